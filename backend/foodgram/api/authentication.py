@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from recipes.catalog import default_cache_is_shared
+from users.tokens import get_token_version, token_digest
+from .cache import LRUCache
+
+
+class SharedTokenCache:
+    def get(self, key):
+        return cache.get(f'token:{token_digest(key)}')
+
+    def set(self, key, value):
+        cache.set(f'token:{token_digest(key)}', value,
+                  settings.TOKEN_CACHE_TTL)
+
+
+def get_token_cache():
+    if not default_cache_is_shared():
+        # Token versions would be per process: a logout handled by one
+        # worker would not reach the entries of the others.
+        return None
+    if settings.TOKEN_CACHE_SHARED:
+        return SharedTokenCache()
+    return LRUCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+token_cache = get_token_cache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the token/user query for known tokens.
+
+    Tokens are kept for TOKEN_CACHE_TTL in a per-worker LRU, or in the
+    default cache with TOKEN_CACHE_SHARED. An entry is only used while the
+    token's version is unchanged; the version is bumped when the token is
+    deleted (djoser logout) and when its user is saved (password change,
+    deactivation). Versions have to be seen by every worker, so nothing is
+    cached unless the default cache is shared between processes.
+    """
+
+    def authenticate_credentials(self, key):
+        if token_cache is None:
+            return super().authenticate_credentials(key)
+        version = get_token_version(key)
+        cached = token_cache.get(key)
+        if cached is not None and cached[1] == version:
+            token = cached[0]
+        else:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, (token, version))
+        return token.user, token
@@ -0,0 +1,82 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import CartIngredient
+
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+
+
+def shopping_list_lines(user):
+    return (CartIngredient.objects
+            .filter(user=user)
+            .values('ingredient__name', 'ingredient__measurement_unit',
+                    'amount')
+            .order_by('ingredient__name')
+            .iterator())
+
+
+def export_txt(lines):
+    for line in lines:
+        yield (f'{line["ingredient__name"]}  '
+               f'{line["ingredient__measurement_unit"]}  '
+               f'{line["amount"]} \n')
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(lines):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount'])
+    for line in lines:
+        yield writer.writerow([line['ingredient__name'],
+                               line['ingredient__measurement_unit'],
+                               line['amount']])
+
+
+def pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.SHOPPING_LIST_PDF_FONT):
+        return 'Helvetica'
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT))
+    return PDF_FONT_NAME
+
+
+def export_pdf(lines):
+    buffer = io.BytesIO()
+    font = pdf_font()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    y = height - PDF_MARGIN
+    page.setFont(font, PDF_FONT_SIZE)
+    for text in export_txt(lines):
+        if y < PDF_MARGIN:
+            page.showPage()
+            page.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        page.drawString(PDF_MARGIN, y, text.rstrip())
+        y -= PDF_LINE_HEIGHT
+    page.save()
+    buffer.seek(0)
+    return buffer
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8'),
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'pdf': (export_pdf, 'application/pdf'),
+}
@@ -1,10 +1,15 @@
 import base64
+import binascii
+import io
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from django.shortcuts import get_object_or_404
 from django.forms.models import model_to_dict
 from rest_framework import serializers
 
+from recipes.images import process_image, variant_names
 from recipes.models import Tag
 
 
@@ -18,12 +23,78 @@ class TagsField(serializers.Field):
         return data
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """ManyRelatedField that looks all primary keys up with one query
+    instead of one per item."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pks = []
+        for item in data:
+            try:
+                pks.append(int(child.pk_field.to_internal_value(item)))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+        objects = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
 class ImageField(serializers.Field):
 
     def to_representation(self, value):
         return value.url
 
     def to_internal_value(self, data):
-        format, imgstr = data.split(';base64,')
-        ext = format.split('/')[-1]
-        return ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if isinstance(data, UploadedFile):
+            if data.size > max_size:
+                raise serializers.ValidationError(
+                    f'Размер изображения не должен превышать {max_size} байт')
+            return self.process(data)
+        try:
+            _, imgstr = data.split(';base64,')
+        except (AttributeError, ValueError):
+            raise serializers.ValidationError(
+                'Изображение должно быть передано в формате base64')
+        if len(imgstr) * 3 // 4 > max_size:
+            raise serializers.ValidationError(
+                f'Размер изображения не должен превышать {max_size} байт')
+        try:
+            source = io.BytesIO(base64.b64decode(imgstr))
+        except binascii.Error:
+            raise serializers.ValidationError('Некорректные данные base64')
+        return self.process(source)
+
+    def process(self, source):
+        try:
+            return process_image(source)
+        except ValidationError as error:
+            raise serializers.ValidationError(error.messages)
+
+
+class ImageVariantsField(serializers.Field):
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or None
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return {
+            size: {
+                variant: request.build_absolute_uri(value.storage.url(name))
+                for variant, name in variants.items()
+            }
+            for size, variants in variant_names(value.name).items()
+        }
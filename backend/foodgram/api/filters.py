@@ -1,7 +1,16 @@
-from django_filters import FilterSet, ModelMultipleChoiceFilter, BooleanFilter
+from django_filters import (BaseInFilter, BooleanFilter, CharFilter,
+                            ChoiceFilter, FilterSet, ModelMultipleChoiceFilter,
+                            NumberFilter)
 from django_filters.widgets import BooleanWidget
 
 from recipes.models import Recipe, Tag
+from recipes.popularity import POPULAR, POPULAR_ORDERING
+from recipes.recipe_index import MATCH_ALL, MATCH_ANY, recipe_index
+from recipes.search import search_recipes
+
+
+class NumberInFilter(BaseInFilter, NumberFilter):
+    pass
 
 
 class RecipeFilter(FilterSet):
@@ -13,6 +22,14 @@ class RecipeFilter(FilterSet):
     is_favorited = BooleanFilter(method="favorited", widget=BooleanWidget())
     is_in_shopping_cart = BooleanFilter(method="shopping_cart",
                                         widget=BooleanWidget())
+    search = CharFilter(method='search_filter')
+    ingredients = NumberInFilter(method='ingredients_filter')
+    exclude_ingredients = NumberInFilter(method='exclude_ingredients_filter')
+    match = ChoiceFilter(
+        choices=((MATCH_ALL, MATCH_ALL), (MATCH_ANY, MATCH_ANY)),
+        method='match_filter')
+    ordering = ChoiceFilter(choices=((POPULAR, POPULAR),),
+                            method='ordering_filter')
 
     def favorited(self, queryset, name, value):
         user = self.request.user
@@ -26,6 +43,28 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shop_list__user=user)
         return queryset
 
+    def search_filter(self, queryset, name, value):
+        value = value.strip()
+        if value:
+            return search_recipes(queryset, value)
+        return queryset
+
+    def ingredients_filter(self, queryset, name, value):
+        match = self.form.cleaned_data.get('match') or MATCH_ALL
+        return recipe_index.filter(queryset, map(int, value), match)
+
+    def exclude_ingredients_filter(self, queryset, name, value):
+        return recipe_index.filter(queryset, map(int, value), MATCH_ANY,
+                                   exclude=True)
+
+    def match_filter(self, queryset, name, value):
+        return queryset
+
+    def ordering_filter(self, queryset, name, value):
+        return queryset.order_by(*POPULAR_ORDERING)
+
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ingredients', 'exclude_ingredients', 'match',
+                  'ordering']
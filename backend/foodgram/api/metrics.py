@@ -0,0 +1,126 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+PREFIX = 'foodgram'
+
+
+class QueryTimer:
+    """Execute wrapper counting SQL queries and keeping the slowest ones."""
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            entry = (duration, self.count, sql)
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, entry)
+            elif self.keep:
+                heapq.heappushpop(self.slowest, entry)
+
+    def worst(self):
+        return sorted(self.slowest, reverse=True)
+
+
+class RouteStats:
+    def __init__(self, buckets):
+        self.buckets = [0] * len(buckets)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_duration = 0.0
+
+
+class MetricsRegistry:
+    """Per-route request histograms of the current worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    @property
+    def bucket_bounds(self):
+        return settings.REQUEST_METRICS_BUCKETS
+
+    def observe(self, method, route, status, duration, timer):
+        bounds = self.bucket_bounds
+        key = (method, route, str(status))
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats(bounds)
+            position = bisect_left(bounds, duration)
+            if position < len(bounds):
+                stats.buckets[position] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += timer.count
+            stats.db_duration += timer.duration
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format."""
+        durations, queries, db_durations = [], [], []
+        with self._lock:
+            for (method, route, status), stats in sorted(
+                    self._routes.items()):
+                labels = (f'method="{escape(method)}",'
+                          f'route="{escape(route)}",status="{status}"')
+                cumulative = 0
+                for bound, count in zip(self.bucket_bounds, stats.buckets):
+                    cumulative += count
+                    durations.append(
+                        f'{PREFIX}_request_duration_seconds_bucket'
+                        f'{{{labels},le="{bound}"}} {cumulative}')
+                durations.extend((
+                    f'{PREFIX}_request_duration_seconds_bucket'
+                    f'{{{labels},le="+Inf"}} {stats.count}',
+                    f'{PREFIX}_request_duration_seconds_sum'
+                    f'{{{labels}}} {stats.duration}',
+                    f'{PREFIX}_request_duration_seconds_count'
+                    f'{{{labels}}} {stats.count}',
+                ))
+                queries.append(
+                    f'{PREFIX}_db_queries_total{{{labels}}} {stats.queries}')
+                db_durations.append(
+                    f'{PREFIX}_db_duration_seconds_total'
+                    f'{{{labels}}} {stats.db_duration}')
+        return '\n'.join((
+            f'# HELP {PREFIX}_request_duration_seconds '
+            'Request duration in seconds.',
+            f'# TYPE {PREFIX}_request_duration_seconds histogram',
+            *durations,
+            f'# HELP {PREFIX}_db_queries_total '
+            'SQL queries executed by requests.',
+            f'# TYPE {PREFIX}_db_queries_total counter',
+            *queries,
+            f'# HELP {PREFIX}_db_duration_seconds_total '
+            'Time spent in SQL queries in seconds.',
+            f'# TYPE {PREFIX}_db_duration_seconds_total counter',
+            *db_durations,
+        )) + '\n'
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\')
+            .replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,83 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .metrics import QueryTimer, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """Per-request SQL and timing instrumentation.
+
+    Adds a Server-Timing header (db, app, render, total), logs requests
+    slower than REQUEST_METRICS_SLOW_MS with their slowest queries and feeds
+    the per-route histograms served by the metrics view. "app" is the view
+    time outside SQL, including serialization; "render" is the response
+    rendering that DRF defers until the view has returned.
+
+    Streaming responses run their queries while the body is sent, after
+    the headers: they get no Server-Timing header and are recorded once
+    the stream is exhausted.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        request.view_finished = None
+        timer = QueryTimer(settings.REQUEST_METRICS_SLOW_QUERIES)
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                request, response, response.streaming_content, started,
+                timer)
+            return response
+        total = time.perf_counter() - started
+        view_finished = request.view_finished or started + total
+        render = started + total - view_finished
+        app = max(total - render - timer.duration, 0)
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.1f}'
+            for name, duration in (('db', timer.duration), ('app', app),
+                                   ('render', render), ('total', total)))
+        self.record(request, response, total, timer)
+        return response
+
+    def measure_stream(self, request, response, content, started, timer):
+        with connection.execute_wrapper(timer):
+            yield from content
+        self.record(request, response, time.perf_counter() - started, timer)
+
+    def record(self, request, response, total, timer):
+        route = self.get_route(request)
+        metrics.observe(request.method, route, response.status_code,
+                        total, timer)
+        if total * 1000 >= settings.REQUEST_METRICS_SLOW_MS:
+            self.log_slow_request(request, route, total, timer)
+
+    def process_template_response(self, request, response):
+        request.view_finished = time.perf_counter()
+        return response
+
+    def get_route(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unmatched'
+        return match.route
+
+    def log_slow_request(self, request, route, total, timer):
+        queries = ''.join(
+            f'\n  {duration * 1000:.1f} ms: {sql[:500]}'
+            for duration, _, sql in timer.worst())
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.1f ms, SQL: %d за %.1f ms%s',
+            request.method, request.get_full_path(), route, total * 1000,
+            timer.count, timer.duration * 1000, queries)
@@ -1,9 +1,21 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from rest_framework import mixins, status, viewsets
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
+from recipes.batch import (add_recipes, existing_recipes, lock_user,
+                           remove_recipes)
+from recipes.catalog import default_cache_is_shared, get_version
 from recipes.models import Recipe
+from .cache import LRUCache
+
+catalog_payloads = LRUCache(settings.CATALOG_CACHE_SIZE,
+                            settings.CATALOG_CACHE_TTL)
 
 
 class CreateListDeleteViewSet(mixins.CreateModelMixin,
@@ -21,6 +33,44 @@ class ListOneMixin(mixins.ListModelMixin,
     pass
 
 
+class CatalogCacheMixin:
+    """Cache list payloads per worker until the catalog version changes.
+
+    Responses carry an ETag built from the catalog version and the query
+    string, so clients revalidating an unchanged catalog get a 304. The
+    ETag is only sent when the version is shared between workers: a local
+    version is not bumped by edits handled elsewhere, so its ETag would
+    keep validating stale copies after CATALOG_CACHE_TTL.
+    """
+    catalog = None
+
+    def get_catalog_payload(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs).data
+
+    def get_etag(self, version, query):
+        if not default_cache_is_shared():
+            return None
+        digest = hashlib.md5(query.encode()).hexdigest()[:8]
+        return f'"{self.catalog}-{version}-{digest}"'
+
+    def list(self, request, *args, **kwargs):
+        version = get_version(self.catalog)
+        query = request.query_params.urlencode()
+        etag = self.get_etag(version, query)
+        headers = {} if etag is None else {'ETag': etag}
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag is not None and (etag in if_none_match
+                                 or '*' in if_none_match):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        key = (self.catalog, version, query)
+        data = catalog_payloads.get(key)
+        if data is None:
+            data = self.get_catalog_payload(request, *args, **kwargs)
+            catalog_payloads.set(key, data)
+        return Response(data, headers=headers)
+
+
 class CreateDestroyMixin(mixins.CreateModelMixin,
                          mixins.DestroyModelMixin,
                          viewsets.GenericViewSet):
@@ -28,19 +78,66 @@ class CreateDestroyMixin(mixins.CreateModelMixin,
 
 
 class ShoppingFavoriteMixin(CreateDestroyMixin):
+    """Single-recipe changes take the same per-user lock as the batch
+    endpoints, so a batch never counts a row inserted or deleted here."""
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
         recipe = get_object_or_404(Recipe, id=self.kwargs.get('recipe_id'))
         return self.model.objects.filter(recipe=recipe)
 
+    @transaction.atomic
+    def create(self, request, *args, **kwargs):
+        lock_user(request.user.id)
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         recipe = get_object_or_404(Recipe, id=self.kwargs.get('recipe_id'))
         serializer.save(user=self.request.user, recipe=recipe)
 
+    @transaction.atomic
     def destroy(self, request, *args, **kwargs):
+        lock_user(request.user.id)
         recipe = get_object_or_404(Recipe, id=self.kwargs.get('recipe_id'))
         user = self.request.user
         instance = get_object_or_404(self.model, recipe=recipe, user=user)
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BatchShoppingFavoriteMixin(viewsets.GenericViewSet):
+    """Add or remove many recipes at once; answers with a status per id."""
+    permission_classes = (IsAuthenticated,)
+
+    def get_recipe_ids(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        return recipe_ids, existing_recipes(recipe_ids)
+
+    def batch_response(self, recipe_ids, found, done, done_status,
+                       skipped_status):
+        results = []
+        for recipe_id in recipe_ids:
+            if recipe_id in done:
+                outcome = done_status
+            elif recipe_id in found:
+                outcome = skipped_status
+            else:
+                outcome = 'not_found'
+            results.append({'id': recipe_id, 'status': outcome})
+        return Response({'results': results})
+
+    def add(self, request, *args, **kwargs):
+        recipe_ids, found = self.get_recipe_ids(request)
+        added = add_recipes(
+            self.model, request.user.id,
+            [recipe_id for recipe_id in recipe_ids if recipe_id in found])
+        return self.batch_response(recipe_ids, found, added, 'added',
+                                   'already_added')
+
+    def remove(self, request, *args, **kwargs):
+        recipe_ids, found = self.get_recipe_ids(request)
+        removed = remove_recipes(self.model, request.user.id, found)
+        return self.batch_response(recipe_ids, found, removed, 'removed',
+                                   'not_added')
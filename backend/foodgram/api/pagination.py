@@ -0,0 +1,170 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (LimitOffsetPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.models import TimelineEntry
+from recipes.popularity import POPULAR_ORDERING
+
+
+class KeysetPaginationMixin:
+    """Keyset pagination, switched on by the ``cursor`` query parameter.
+
+    A page is selected with a WHERE on the ordering key of the last row
+    of the previous page instead of an OFFSET, so deep pages cost the same
+    as the first one. The total count is only computed on ``?count=true``.
+    Requests without ``cursor`` keep the paginator's usual contract.
+    A queryset explicitly ordered by one of ``orderings`` is paginated by
+    that ordering instead of ``keyset``.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset = None
+    orderings = ()
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def get_keyset_limit(self, request):
+        raise NotImplementedError
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.cursor_query_param in request.query_params
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        ordering = tuple(queryset.query.order_by)
+        if ordering in self.orderings:
+            self.keyset = ordering
+        limit = self.get_keyset_limit(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param], queryset.model)
+        queryset = queryset.order_by(*self.keyset)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+        page = list(queryset[:limit + 1])
+        self.next_position = None
+        if len(page) > limit:
+            page = page[:limit]
+            self.next_position = self.get_position(page[-1])
+        return page
+
+    def keyset_filter(self, position):
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.keyset, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, instance):
+        position = []
+        for field in self.keyset:
+            name = field.lstrip('-')
+            value = (instance[name] if isinstance(instance, dict)
+                     else getattr(instance, name))
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, cursor, model):
+        """Ordering key from a cursor, each value parsed by the model field
+        it is compared with."""
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if (not isinstance(position, list)
+                    or len(position) != len(self.keyset)
+                    or None in position):
+                raise ValueError
+            return [model._meta.get_field(field.lstrip('-')).to_python(value)
+                    for field, value in zip(self.keyset, position)]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_cursor_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_cursor_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+
+class RecipePagination(KeysetPaginationMixin, LimitOffsetPagination):
+    keyset = ('-pub_date', '-id')
+    orderings = (POPULAR_ORDERING,)
+
+    def get_keyset_limit(self, request):
+        return self.get_limit(request)
+
+
+class FollowPagination(KeysetPaginationMixin, PageNumberPagination):
+    keyset = ('-id',)
+    page_size_query_param = 'limit'
+
+    def get_keyset_limit(self, request):
+        return self.get_page_size(request)
+
+
+class FeedPagination(KeysetPaginationMixin, LimitOffsetPagination):
+    """Keyset pages merged from several sources of (pub_date, recipe_id)
+    rows.
+
+    Every source is cut at the cursor and limited on its own, so each is
+    read through its own index; the feed is always paginated by cursor.
+    """
+    keyset = ('-pub_date', '-recipe_id')
+
+    def get_keyset_limit(self, request):
+        return self.get_limit(request)
+
+    def paginate_queryset(self, querysets, request, view=None):
+        self.keyset_mode = True
+        self.request = request
+        self.count = None
+        limit = self.get_keyset_limit(request)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param),
+            TimelineEntry)
+        rows = {}
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.keyset)
+            if position is not None:
+                queryset = queryset.filter(self.keyset_filter(position))
+            for row in queryset[:limit + 1]:
+                rows[row['recipe_id']] = row
+        page = sorted(rows.values(), reverse=True,
+                      key=lambda row: (row['pub_date'], row['recipe_id']))
+        self.next_position = None
+        if len(page) > limit:
+            page = page[:limit]
+            self.next_position = self.get_position(page[-1])
+        return page
@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+from recipes.images import variant_names
+from recipes.models import Recipe, RecipeIngridient
+from recipes.relations import UserRelations
+
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name', 'id',
+                 'recipes_count', 'followers_count')
+RECIPE_FIELDS = ('id', 'author_id', 'name', 'text', 'cooking_time', 'image',
+                 'favorites_count', 'shopping_cart_count', 'pub_date',
+                 'popularity',
+                 *(f'author__{field}' for field in AUTHOR_FIELDS))
+
+
+def author_representation(row, following):
+    """CustomUserSerializer output from the author columns of a row."""
+    return {
+        'email': row['author__email'],
+        'username': row['author__username'],
+        'first_name': row['author__first_name'],
+        'last_name': row['author__last_name'],
+        'id': row['author_id'],
+        'is_subscribed': row['author_id'] in following,
+        'recipes_count': row['author__recipes_count'],
+        'followers_count': row['author__followers_count'],
+    }
+
+
+def recipe_rows(queryset):
+    """Recipe queryset as plain rows for ``recipe_representations``."""
+    return (queryset.select_related(None).prefetch_related(None)
+            .values(*RECIPE_FIELDS))
+
+
+def recipe_tags(recipe_ids):
+    tags = defaultdict(list)
+    rows = (Recipe.tags.through.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by('recipe_id', 'tag_id')
+            .values_list('recipe_id', 'tag__id', 'tag__slug', 'tag__name',
+                         'tag__color'))
+    for recipe_id, id, slug, name, color in rows:
+        tags[recipe_id].append(
+            {'id': id, 'slug': slug, 'name': name, 'color': color})
+    return tags
+
+
+def recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = (RecipeIngridient.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by('recipe_id', 'id')
+            .values_list('recipe_id', 'amount', 'ingredient__id',
+                         'ingredient__name', 'ingredient__measurement_unit'))
+    for recipe_id, amount, id, name, measurement_unit in rows:
+        ingredients[recipe_id].append(
+            {'amount': amount, 'id': id, 'name': name,
+             'measurement_unit': measurement_unit})
+    return ingredients
+
+
+def image_urls(name, request):
+    if not name:
+        return None, None
+    storage = Recipe._meta.get_field('image').storage
+    variants = {
+        size: {
+            variant: request.build_absolute_uri(storage.url(variant_name))
+            for variant, variant_name in names.items()
+        }
+        for size, names in variant_names(name).items()
+    }
+    return request.build_absolute_uri(storage.url(name)), variants
+
+
+def recipe_representations(rows, request):
+    """Build RecipeSerializer output from ``recipe_rows`` without
+    instantiating models or serializer fields.
+
+    Keys are emitted in the serializers' field order, so the rendered JSON
+    is identical to the serializer path.
+    """
+    rows = list(rows)
+    recipe_ids = [row['id'] for row in rows]
+    tags = recipe_tags(recipe_ids)
+    ingredients = recipe_ingredients(recipe_ids)
+    relations = UserRelations(request.user.id)
+    following = relations.following
+    favorites = relations.favorites
+    shopping_cart = relations.shopping_cart
+    data = []
+    for row in rows:
+        image, image_variants = image_urls(row['image'], request)
+        recipe_id = row['id']
+        data.append({
+            'id': recipe_id,
+            'tags': tags[recipe_id],
+            'author': author_representation(row, following),
+            'ingredients': ingredients[recipe_id],
+            'name': row['name'],
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+            'image': image,
+            'image_variants': image_variants,
+            'is_favorited': recipe_id in favorites,
+            'is_in_shopping_cart': recipe_id in shopping_cart,
+            'favorites_count': row['favorites_count'],
+            'shopping_cart_count': row['shopping_cart_count'],
+        })
+    return data
@@ -1,11 +1,17 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 
-from recipes.models import (Favorite, Follow, Ingredient, Recipe,
-                            RecipeIngridient, ShoppingList, Tag)
-from .fields import ImageField, TagsField
+from recipes.cart import recipe_ingredients_changed
+from recipes.models import (CartIngredient, Favorite, Follow, Ingredient,
+                            Recipe, RecipeIngridient, ShoppingList, Tag)
+from recipes.recipe_index import publish_change
+from recipes.relations import UserRelations
+from .fields import (BulkManyRelatedField, ImageField, ImageVariantsField,
+                     TagsField)
 
 User = get_user_model()
 
@@ -16,12 +22,12 @@ class CustomUserSerializer(UserSerializer):
     class Meta:
         model = User
         fields = ('email', 'username', 'first_name',
-                  'last_name', 'id', 'is_subscribed')
-        read_only_fields = ['id']
+                  'last_name', 'id', 'is_subscribed',
+                  'recipes_count', 'followers_count')
+        read_only_fields = ['id', 'recipes_count', 'followers_count']
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return Follow.objects.filter(user=user, author=obj).exists()
+        return obj.id in UserRelations.from_context(self.context).following
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -51,57 +57,72 @@ class RecipeIngridientsSerializer(serializers.ModelSerializer):
         fields = ('amount', 'id', 'name', 'measurement_unit')
 
 
+class CartIngredientSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = CartIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngridientsSerializer(source='recipeingridient_set',
                                               read_only=True,
                                               many=True)
-    is_favorited = serializers.BooleanField(read_only=True)
-    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    is_favorited = serializers.SerializerMethodField(read_only=True)
+    is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
-                  'name', 'text', 'cooking_time', 'image',
-                  'is_favorited', 'is_in_shopping_cart')
+                  'name', 'text', 'cooking_time', 'image', 'image_variants',
+                  'is_favorited', 'is_in_shopping_cart',
+                  'favorites_count', 'shopping_cart_count')
+        read_only_fields = ['favorites_count', 'shopping_cart_count']
+
+    def get_is_favorited(self, obj):
+        return obj.id in UserRelations.from_context(self.context).favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        relations = UserRelations.from_context(self.context)
+        return obj.id in relations.shopping_cart
 
 
 class RecipeSerializerCreate(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
-        pk_field=TagsField()
+    tags = BulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all(),
+            pk_field=TagsField()
+        )
     )
     image = ImageField()
-    author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngridientsSerializer(source='recipeingridient_set',
                                               many=True)
-    is_favorited = serializers.SerializerMethodField(read_only=True)
-    is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = ('tags', 'ingredients', 'name', 'text',
-                  'cooking_time', 'image', 'id', 'author',
-                  'is_favorited', 'is_in_shopping_cart')
-        read_only_fields = ['id', 'author',
-                            'is_favorited', 'is_in_shopping_cart']
-
-    def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return Favorite.objects.filter(user=user, recipe=obj).exists()
+                  'cooking_time', 'image', 'id')
+        read_only_fields = ['id']
 
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return ShoppingList.objects.filter(user=user, recipe=obj).exists()
+    def to_representation(self, instance):
+        instance = Recipe.objects.with_related().get(pk=instance.pk)
+        return RecipeSerializer(instance, context=self.context).data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipeingridient_set')
         tags_data = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         return self.update_related_data(ingredients_data, tags_data, recipe)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('recipeingridient_set')
         tags_data = validated_data.pop('tags')
@@ -109,17 +130,48 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
         return self.update_related_data(ingredients_data, tags_data, instance)
 
     def update_related_data(self, ingredients_data, tags_data, recipe):
-        recipe.tags.clear()
-        for tag in tags_data:
-            recipe.tags.add(tag)
-        for ingredient_el in ingredients_data:
-            ingredient_id = ingredient_el['ingredient'].get('id')
-            ingredient = get_object_or_404(Ingredient, id=ingredient_id)
-            RecipeIngridient.objects.update_or_create(
-                recipe=recipe,
-                ingredient=ingredient,
-                amount=ingredient_el['amount']
-            )
+        recipe.tags.set(tags_data)
+        amounts = {
+            ingredient_el['ingredient']['id']: ingredient_el['amount']
+            for ingredient_el in ingredients_data
+        }
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipeingridient_set.all()
+        }
+        removed = existing.keys() - amounts.keys()
+        added = amounts.keys() - existing.keys()
+        deltas = {ingredient_id: amounts[ingredient_id]
+                  for ingredient_id in added}
+        changed = []
+        for ingredient_id in removed:
+            deltas[ingredient_id] = -existing[ingredient_id].amount
+        for ingredient_id in existing.keys() & amounts.keys():
+            recipe_ingredient = existing[ingredient_id]
+            if recipe_ingredient.amount != amounts[ingredient_id]:
+                deltas[ingredient_id] = (amounts[ingredient_id]
+                                         - recipe_ingredient.amount)
+                recipe_ingredient.amount = amounts[ingredient_id]
+                changed.append(recipe_ingredient)
+        if removed:
+            recipe.recipeingridient_set.filter(
+                ingredient_id__in=removed).delete()
+        if changed:
+            RecipeIngridient.objects.bulk_update(changed, ['amount'])
+        RecipeIngridient.objects.bulk_create(
+            RecipeIngridient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amounts[ingredient_id])
+            for ingredient_id in added
+        )
+        if removed or added:
+            publish_change(
+                added=((ingredient_id, recipe.id) for ingredient_id in added),
+                removed=((ingredient_id, recipe.id)
+                         for ingredient_id in removed))
+            if not recipe.neighbours_stale:
+                Recipe.objects.filter(pk=recipe.pk).mark_neighbours_stale()
+        if recipe.shopping_cart_count:
+            recipe_ingredients_changed(recipe.id, deltas)
         return recipe
 
     def validate(self, data):
@@ -139,12 +191,27 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
         if len(ingredients) != len(set(ingredients)):
             raise serializers.ValidationError(
                 'В запросе присутствуют дублирующиеся ингредиенты')
+        if len(Ingredient.objects.in_bulk(ingredients)) != len(ingredients):
+            raise serializers.ValidationError(
+                'В запросе присутствуют несуществующие ингредиенты')
         if len(data['tags']) != len(set(data['tags'])):
             raise serializers.ValidationError(
                 'В запросе присутствуют дублирующиеся тэги')
         return data
 
 
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = ImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    def to_representation(self, instance):
+        instance = Recipe.objects.with_related().get(pk=instance.pk)
+        return RecipeSerializer(instance, context=self.context).data
+
+
 class ShoppingListSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='recipe.id', read_only=True)
     name = serializers.CharField(source='recipe.name', read_only=True)
@@ -196,11 +263,28 @@ class FavoriteSerializer(serializers.ModelSerializer):
         return data
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.BATCH_RECIPES_LIMIT)
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image')
+        fields = ('id', 'name', 'cooking_time', 'image', 'image_variants')
+
+
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None or not recipes_limit.isdigit():
+        return None
+    return int(recipes_limit)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -219,11 +303,10 @@ class FollowSerializer(serializers.ModelSerializer):
                                        read_only=True)
     last_name = serializers.CharField(source='author.last_name',
                                       read_only=True)
-    recipes_count = serializers.IntegerField(read_only=True)
-    is_subscribed = serializers.BooleanField(read_only=True)
-    recipes = RecipeShortSerializer(source='author.recipes',
-                                    many=True,
-                                    read_only=True)
+    recipes_count = serializers.IntegerField(source='author.recipes_count',
+                                             read_only=True)
+    is_subscribed = serializers.SerializerMethodField(read_only=True)
+    recipes = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Follow
@@ -231,6 +314,20 @@ class FollowSerializer(serializers.ModelSerializer):
                   'first_name', 'last_name',
                   'recipes_count', 'recipes', 'is_subscribed')
 
+    def get_recipes(self, obj):
+        recipes = getattr(obj.author, 'preview_recipes', None)
+        if recipes is None:
+            recipes = obj.author.recipes.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
+        return RecipeShortSerializer(recipes, many=True,
+                                     context=self.context).data
+
+    def get_is_subscribed(self, obj):
+        relations = UserRelations.from_context(self.context)
+        return obj.author_id in relations.following
+
     def validate(self, data):
         request = self.context.get('request')
         if request.method == 'DELETE':
@@ -0,0 +1,673 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.admin import RecipeIngridientAdmin
+from recipes.cart import rebuild_cart_totals
+from recipes.counters import recount
+from recipes.feed import rebuild_timelines
+from recipes.models import (CartIngredient, Favorite, Follow, Ingredient,
+                            Recipe, RecipeIngridient, ShoppingList, Tag,
+                            TimelineEntry)
+from recipes.images import variant_names
+from recipes.recipe_index import (MATCH_ALL, MATCH_ANY,
+                                  RecipeIngredientIndex)
+from recipes.transfer import RecipeImporter, export_recipes
+from users.models import User
+from .renderers import FastJSONRenderer
+from .representations import recipe_representations, recipe_rows
+from .serializers import RecipeSerializer
+
+MEDIA_ROOT = tempfile.mkdtemp()
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcS'
+         'JAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeQueryCountTests(TestCase):
+    """The number of queries per recipe endpoint does not grow with the
+    number of recipes, tags or ingredients."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.tags = [Tag.objects.create(name=f'Тэг {i}', slug=f'tag-{i}',
+                                       color='#ffffff') for i in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(10)
+        ]
+        for i in range(100):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {i}', text='Текст',
+                cooking_time=10, image='recipes/image.png')
+            recipe.tags.set(cls.tags)
+            RecipeIngridient.objects.bulk_create(
+                RecipeIngridient(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in cls.ingredients)
+        cls.recipe = recipe
+        Follow.objects.create(user=cls.user, author=cls.author)
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def recipe_data(self, tags, ingredients):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Текст',
+            'cooking_time': 5,
+            'image': IMAGE,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [{'id': ingredient.id, 'amount': 2}
+                            for ingredient in ingredients],
+        }
+
+    def test_list(self):
+        # Favorite, cart and subscription flags come from per-user id sets
+        # that are cached after the first request.
+        self.client.get('/api/recipes/', {'limit': 100})
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/', {'limit': 100})
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_list_anonymous(self):
+        with self.assertNumQueries(4):
+            response = APIClient().get('/api/recipes/', {'limit': 100})
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_detail(self):
+        self.client.get(f'/api/recipes/{self.recipe.id}/')
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(len(response.data['ingredients']), 10)
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_create(self):
+        # Includes the three queries loading the cleared relation id sets.
+        data = self.recipe_data(self.tags, self.ingredients)
+        with self.assertNumQueries(19):
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['ingredients']), 10)
+
+    def test_update(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст', cooking_time=10)
+        recipe.tags.set(self.tags)
+        RecipeIngridient.objects.bulk_create(
+            RecipeIngridient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients)
+        data = self.recipe_data(self.tags[:1], self.ingredients[5:])
+        with self.assertNumQueries(18):
+            response = self.client.put(f'/api/recipes/{recipe.id}/', data,
+                                       format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['ingredients']), 5)
+
+
+class CatalogCacheTests(TestCase):
+    """Catalog ETags are only sent when every worker sees the version."""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+    def test_no_etag_with_local_cache(self):
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#ffffff')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_etag_with_shared_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}
+        with override_settings(CACHES=shared):
+            Tag.objects.create(name='Завтрак', slug='breakfast',
+                               color='#ffffff')
+            etag = self.client.get('/api/tags/')['ETag']
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            Tag.objects.create(name='Обед', slug='lunch', color='#000000')
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), 2)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeImageFilesTests(TransactionTestCase):
+    """Replaced and deleted images do not leave files behind."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ingredient = Ingredient.objects.create(name='Соль',
+                                                    measurement_unit='г')
+        self.tag = Tag.objects.create(name='Обед', slug='lunch',
+                                      color='#ffffff')
+
+    def stored_files(self, name):
+        names = [name] + [variant for variants in variant_names(name).values()
+                          for variant in variants.values()]
+        return [os.path.exists(os.path.join(MEDIA_ROOT, name))
+                for name in names]
+
+    def test_replace_and_delete(self):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Суп', 'text': 'Текст', 'cooking_time': 5,
+            'image': IMAGE, 'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+        }, format='json')
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        first = recipe.image.name
+        self.assertEqual(self.stored_files(first), [True] * 5)
+
+        response = self.client.put(
+            f'/api/recipes/{recipe.id}/image/',
+            base64.b64decode(IMAGE.split(',')[1]), content_type='image/png')
+        self.assertEqual(response.status_code, 200)
+        second = Recipe.objects.get(pk=recipe.id).image.name
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.stored_files(first), [False] * 5)
+        self.assertEqual(self.stored_files(second), [True] * 5)
+
+        self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(self.stored_files(second), [False] * 5)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeRepresentationTests(TestCase):
+    """Recipes built from rows render to the same bytes as through
+    RecipeSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password', first_name='Вася\u2028',
+            last_name='"Пупкин"')
+        tags = [Tag.objects.create(name=f'Тэг {i}', slug=f'tag-{i}',
+                                   color='#ffffff') for i in range(2)]
+        ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}',
+                                                 measurement_unit='г')
+                       for i in range(3)]
+        for i in range(4):
+            recipe = Recipe.objects.create(
+                author=author if i % 2 else cls.user, name=f'Рецепт «{i}»',
+                text='Текст\nс переводом строки', cooking_time=i,
+                image='recipes/image.jpg' if i % 3 else None)
+            recipe.tags.set(tags[:i % 3])
+            RecipeIngridient.objects.bulk_create(
+                RecipeIngridient(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in ingredients[i % 2:])
+        Follow.objects.create(user=cls.user, author=author)
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def render_both(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        recipes = Recipe.objects.with_related().order_by('id')
+        expected = JSONRenderer().render(RecipeSerializer(
+            recipes, many=True, context={'request': request}).data)
+        actual = FastJSONRenderer().render(recipe_representations(
+            recipe_rows(recipes), request))
+        return expected, actual
+
+    def test_same_bytes(self):
+        expected, actual = self.render_both(self.user)
+        self.assertIn(b'"is_favorited":true', expected)
+        self.assertEqual(actual, expected)
+
+    def test_same_bytes_anonymous(self):
+        expected, actual = self.render_both(AnonymousUser())
+        self.assertEqual(actual, expected)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CartTotalsTests(TestCase):
+    """Stored cart totals match the cart contents after every write path."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch',
+                                     color='#ffffff')
+        cls.ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}',
+                                                     measurement_unit='г')
+                           for i in range(4)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = self.create_recipe({0: 10, 1: 20})
+
+    def recipe_data(self, amounts):
+        return {
+            'name': 'Суп', 'text': 'Текст', 'cooking_time': 5,
+            'image': IMAGE, 'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredients[index].id,
+                             'amount': amount}
+                            for index, amount in amounts.items()],
+        }
+
+    def create_recipe(self, amounts):
+        response = self.client.post('/api/recipes/',
+                                    self.recipe_data(amounts), format='json')
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def add_to_cart(self, recipe):
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+
+    def assert_totals(self, expected):
+        self.assertEqual(rebuild_cart_totals(fix=False), 0)
+        self.assertEqual(
+            dict(CartIngredient.objects.filter(user=self.user)
+                 .values_list('ingredient_id', 'amount')),
+            {self.ingredients[index].id: amount
+             for index, amount in expected.items()})
+
+    def test_cart_and_recipe_writes(self):
+        self.add_to_cart(self.recipe)
+        other = self.create_recipe({1: 5, 2: 7})
+        self.add_to_cart(other)
+        self.assert_totals({0: 10, 1: 25, 2: 7})
+
+        self.client.put(f'/api/recipes/{self.recipe.id}/',
+                        self.recipe_data({1: 1, 3: 3}), format='json')
+        self.assert_totals({1: 6, 2: 7, 3: 3})
+
+        self.client.delete(f'/api/recipes/{other.id}/shopping_cart/')
+        self.assert_totals({1: 1, 3: 3})
+
+        self.client.delete(f'/api/recipes/{self.recipe.id}/')
+        self.assert_totals({})
+
+    def test_recipe_ingredient_writes(self):
+        self.add_to_cart(self.recipe)
+        row = RecipeIngridient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredients[2], amount=4)
+        self.assert_totals({0: 10, 1: 20, 2: 4})
+
+        self.client.delete(f'/api/rec/{row.id}/')
+        self.assert_totals({0: 10, 1: 20})
+
+    def test_admin_writes(self):
+        self.add_to_cart(self.recipe)
+        model_admin = RecipeIngridientAdmin(RecipeIngridient, admin.site)
+        rows = {row.ingredient_id: row
+                for row in self.recipe.recipeingridient_set.all()}
+        row = rows[self.ingredients[0].id]
+        row.amount = 15
+        model_admin.save_model(None, row, None, change=True)
+        self.assert_totals({0: 15, 1: 20})
+
+        model_admin.delete_model(None, row)
+        self.assert_totals({1: 20})
+
+        model_admin.delete_queryset(
+            None, RecipeIngridient.objects.filter(recipe=self.recipe))
+        self.assert_totals({})
+
+
+class BatchTests(TestCase):
+    """Batch endpoints report a status per id and keep counters and cart
+    totals exact."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        ingredient = Ingredient.objects.create(name='Соль',
+                                               measurement_unit='г')
+        cls.recipes = []
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {i}', text='Текст',
+                cooking_time=5)
+            RecipeIngridient.objects.create(recipe=recipe,
+                                            ingredient=ingredient,
+                                            amount=i + 1)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.data['results']]
+
+    def assert_no_drift(self):
+        self.assertEqual(rebuild_cart_totals(fix=False), 0)
+        self.assertEqual(
+            sum(drifted for _, _, drifted in recount(fix=False)), 0)
+
+    def test_cart_batch(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        self.client.post(f'/api/recipes/{first}/shopping_cart/')
+        url = '/api/recipes/shopping_cart/batch/'
+        response = self.client.post(
+            url, {'recipes': [first, second, 999]}, format='json')
+        self.assertEqual(self.statuses(response),
+                         ['already_added', 'added', 'not_found'])
+        self.assert_no_drift()
+        self.assertEqual(
+            CartIngredient.objects.get(user=self.user).amount, 3)
+
+        response = self.client.delete(
+            url, {'recipes': [second, third]}, format='json')
+        self.assertEqual(self.statuses(response), ['removed', 'not_added'])
+        self.assert_no_drift()
+        self.assertEqual(
+            CartIngredient.objects.get(user=self.user).amount, 1)
+
+    def test_favorite_batch(self):
+        first, second, _ = (recipe.id for recipe in self.recipes)
+        url = '/api/recipes/favorite/batch/'
+        response = self.client.post(
+            url, {'recipes': [first, second, first]}, format='json')
+        self.assertEqual(self.statuses(response), ['added', 'added'])
+        self.client.delete(f'/api/recipes/{first}/favorite/')
+        response = self.client.delete(
+            url, {'recipes': [first, second]}, format='json')
+        self.assertEqual(self.statuses(response), ['not_added', 'removed'])
+        self.assert_no_drift()
+        self.assertFalse(Favorite.objects.exists())
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=3,
+                   FEED_FANOUT_RESUME_FOLLOWERS=2)
+class FeedTests(TestCase):
+    """Timelines match the follows, popular authors are read on demand and
+    only switched back to fan-out offline."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.followers = [
+            User.objects.create_user(username=f'user{i}',
+                                     email=f'user{i}@example.com',
+                                     password='password')
+            for i in range(3)
+        ]
+
+    def publish(self):
+        return Recipe.objects.create(author=self.author, name='Рецепт',
+                                     text='Текст', cooking_time=5)
+
+    def feed(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/recipes/feed/')
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def on_demand(self):
+        return User.objects.get(pk=self.author.pk).feed_on_demand
+
+    def test_fan_out_and_switch(self):
+        first = self.publish()
+        for user in self.followers[:2]:
+            Follow.objects.create(user=user, author=self.author)
+        second = self.publish()
+        self.assertEqual(self.feed(self.followers[0]), [second.id, first.id])
+        self.assertEqual(rebuild_timelines(fix=False), 0)
+
+        last = self.followers[2]
+        Follow.objects.create(user=last, author=self.author)
+        self.assertTrue(self.on_demand())
+        third = self.publish()
+        self.assertFalse(TimelineEntry.objects.filter(recipe=third).exists())
+        self.assertEqual(self.feed(last), [third.id, second.id, first.id])
+        self.assertEqual(rebuild_timelines(fix=False), 0)
+
+        # Dropping below the threshold keeps reading on demand.
+        Follow.objects.filter(user=last).delete()
+        self.assertTrue(self.on_demand())
+        self.assertEqual(TimelineEntry.objects.filter(user=last).count(), 0)
+        Follow.objects.filter(user=self.followers[1]).delete()
+        self.assertTrue(self.on_demand())
+        self.assertEqual(self.feed(self.followers[0]),
+                         [third.id, second.id, first.id])
+
+        # The offline rebuild switches the author back and backfills.
+        self.assertEqual(rebuild_timelines(fix=True), 1)
+        self.assertFalse(self.on_demand())
+        self.assertEqual(rebuild_timelines(fix=False), 0)
+        self.assertEqual(self.feed(self.followers[0]),
+                         [third.id, second.id, first.id])
+
+
+class RecipeTransferTests(TestCase):
+    """Exported recipes import back unchanged, with counters and timelines
+    updated batch by batch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password')
+        cls.follower = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        tags = [Tag.objects.create(name=f'Тэг {i}', slug=f'tag-{i}',
+                                   color='#ffffff') for i in range(2)]
+        ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}',
+                                                 measurement_unit='г')
+                       for i in range(3)]
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                author=cls.author if i % 2 else cls.follower,
+                name=f'Рецепт {i}', text='Текст', cooking_time=i + 1)
+            recipe.tags.set(tags[:i % 3])
+            RecipeIngridient.objects.bulk_create(
+                RecipeIngridient(recipe=recipe, ingredient=ingredient,
+                                 amount=i + 1)
+                for ingredient in ingredients[i % 2:])
+
+    def export(self):
+        stream = io.StringIO()
+        export_recipes(stream, chunk_size=2)
+        return stream.getvalue()
+
+    def test_round_trip(self):
+        exported = self.export()
+        Recipe.objects.all().delete()
+        importer = RecipeImporter(batch_size=2)
+        self.assertEqual(importer.import_lines(exported.splitlines()), 5)
+        self.assertEqual(self.export(), exported)
+        self.assertEqual(
+            (importer.created_users, importer.created_tags,
+             importer.created_ingredients), (0, 0, 0))
+        self.assertEqual(
+            sum(drifted for _, _, drifted in recount(fix=False)), 0)
+        self.assertEqual(rebuild_timelines(fix=False), 0)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.follower).count(), 2)
+
+
+class CountingIndex(RecipeIngredientIndex):
+    builds = 0
+
+    def build(self):
+        self.builds += 1
+        return super().build()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeIndexTests(TransactionTestCase):
+    """The ingredient index catches up with every write path and answers
+    like a scan of RecipeIngridient."""
+
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(name='Обед', slug='lunch',
+                                      color='#ffffff')
+        self.ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}',
+                                                      measurement_unit='г')
+                            for i in range(5)]
+        self.recipes = [self.create_recipe(self.ingredients[i:i + 3])
+                        for i in range(3)]
+        self.index = CountingIndex()
+
+    def recipe_data(self, ingredients):
+        return {
+            'name': 'Суп', 'text': 'Текст', 'cooking_time': 5,
+            'image': IMAGE, 'tags': [self.tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 1}
+                            for ingredient in ingredients],
+        }
+
+    def create_recipe(self, ingredients):
+        response = self.client.post('/api/recipes/',
+                                    self.recipe_data(ingredients),
+                                    format='json')
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def brute_force(self, ingredient_ids, match):
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngridient.objects.values_list(
+                'recipe_id', 'ingredient_id'):
+            recipes[recipe_id].add(ingredient_id)
+        wanted = set(ingredient_ids)
+        return {recipe_id for recipe_id, present in recipes.items()
+                if (wanted <= present if match == MATCH_ALL
+                    else wanted & present)}
+
+    def assert_matches_scan(self):
+        ids = [ingredient.id for ingredient in self.ingredients]
+        for ingredient_ids in ([ids[0]], [ids[1], ids[2]], ids[2:],
+                               [ids[4], 999]):
+            for match in (MATCH_ALL, MATCH_ANY):
+                self.assertEqual(self.index.recipes(ingredient_ids, match),
+                                 self.brute_force(ingredient_ids, match))
+
+    def test_catch_up(self):
+        self.assert_matches_scan()
+        recipe = self.create_recipe(self.ingredients[3:])
+        self.assert_matches_scan()
+        self.client.put(f'/api/recipes/{recipe.id}/',
+                        self.recipe_data(self.ingredients[:2]),
+                        format='json')
+        self.assert_matches_scan()
+        row = RecipeIngridient.objects.create(
+            recipe=self.recipes[0], ingredient=self.ingredients[4], amount=1)
+        self.assert_matches_scan()
+        self.client.delete(f'/api/rec/{row.id}/')
+        self.assert_matches_scan()
+        self.client.delete(f'/api/recipes/{self.recipes[1].id}/')
+        self.assert_matches_scan()
+        self.ingredients[2].delete()
+        self.assert_matches_scan()
+        self.assertEqual(self.index.builds, 1)
+
+    def test_filter(self):
+        first, second = self.ingredients[:2]
+        response = self.client.get('/api/recipes/', {
+            'ingredients': f'{first.id},{second.id}', 'match': MATCH_ANY,
+            'exclude_ingredients': self.ingredients[3].id})
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[0].id])
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk the whole list once, in order, ties included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}',
+                                     email=f'author{i}@example.com',
+                                     password='password')
+            for i in range(5)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+            for i in range(2):
+                Recipe.objects.create(author=author, name=f'Рецепт {i}',
+                                      text='Текст', cooking_time=5)
+        # Equal publication dates are told apart by id.
+        Recipe.objects.filter(author=cls.authors[2]).update(
+            pub_date=Recipe.objects.earliest('pub_date').pub_date)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, limit):
+        ids = []
+        response = self.client.get(url, {'cursor': '', 'limit': limit,
+                                         'count': 'true'})
+        count = response.data['count']
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), limit)
+            ids.extend(item['id'] for item in response.data['results'])
+            if response.data['next'] is None:
+                return ids, count
+            response = self.client.get(response.data['next'])
+
+    def test_recipes(self):
+        ids, count = self.walk('/api/recipes/', 3)
+        self.assertEqual(count, 10)
+        self.assertEqual(ids, list(Recipe.objects.order_by('-pub_date', '-id')
+                                   .values_list('id', flat=True)))
+
+    def test_subscriptions(self):
+        ids, count = self.walk('/api/users/subscriptions/', 2)
+        self.assertEqual(count, 5)
+        self.assertEqual(ids, list(self.user.follower.order_by('-id')
+                                   .values_list('author_id', flat=True)))
+
+    def test_invalid_cursor(self):
+        for cursor in ('not base64!', 'WzFd', 'WyJ4IiwxXQ=='):
+            response = self.client.get('/api/recipes/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
@@ -1,10 +1,12 @@
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
-from .views import (FavoriteViewSet, FollowEditViewSet, FollowViewSet,
-                    IngredientsViewSet, RecipeIngridientsViewSet,
-                    RecipeViewSet, ShoppingListViewSet, shopping_list_file,
-                    TagViewSet, UserViewSet)
+from .views import (FavoriteBatchViewSet, FavoriteViewSet,
+                    FollowEditViewSet, FollowViewSet, IngredientsViewSet,
+                    RecipeIngridientsViewSet, RecipeViewSet,
+                    ShoppingListBatchViewSet, ShoppingListViewSet,
+                    shopping_cart, shopping_list_file, TagViewSet,
+                    UserViewSet)
 
 router_v1 = SimpleRouter()
 router_v1.register('tags', TagViewSet, basename='Tag')
@@ -47,6 +49,19 @@ urlpatterns = [
                                       'delete': 'destroy',
                                       }),
          name='shopping_list'),
+    path('recipes/favorite/batch/',
+         FavoriteBatchViewSet.as_view({'post': 'add',
+                                       'delete': 'remove',
+                                       }),
+         name='favorites_batch'),
+    path('recipes/shopping_cart/batch/',
+         ShoppingListBatchViewSet.as_view({'post': 'add',
+                                           'delete': 'remove',
+                                           }),
+         name='shopping_list_batch'),
+    path('recipes/shopping_cart/',
+         shopping_cart,
+         name='shopping_cart'),
     path('recipes/download_shopping_cart/',
          shopping_list_file,
          name='shopping_file'),
@@ -1,43 +1,66 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Exists, OuterRef, Sum
+from django.db.models import Prefetch, prefetch_related_objects
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from djoser import views
-from rest_framework import filters, mixins, status, viewsets
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework import generics, mixins, status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-
+from rest_framework.settings import api_settings
+
+from recipes.cart import recipe_ingredients_removed
+from recipes.catalog import INGREDIENTS, TAGS
+from recipes.feed import feed_sources
+from recipes.popularity import POPULAR_ORDERING
+from recipes.ingredient_index import ingredient_index
+from recipes.recipe_index import publish_change
 from recipes.models import (Favorite, Follow, Ingredient, Recipe,
                             RecipeIngridient, ShoppingList, Tag)
 from .permissions import OwnerOrReadOnly
-from .serializers import (FavoriteSerializer, FollowSerializer,
-                          IngredientSerializer, RecipeIngridientsSerializer,
-                          RecipeSerializer, RecipeSerializerCreate,
-                          ShoppingListSerializer, TagSerializer)
-from .mixins import (CreateDestroyMixin, CreateListDeleteViewSet,
+from .serializers import (CartIngredientSerializer, FavoriteSerializer,
+                          FollowSerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeIngridientsSerializer,
+                          RecipeImageSerializer, RecipeSerializer,
+                          RecipeSerializerCreate, ShoppingListSerializer,
+                          TagSerializer, get_recipes_limit)
+from .mixins import (BatchShoppingFavoriteMixin, CatalogCacheMixin,
+                     CreateDestroyMixin, CreateListDeleteViewSet,
                      ListOneMixin, ShoppingFavoriteMixin)
+from .exporters import EXPORTERS, shopping_list_lines
 from .filters import RecipeFilter
+from .metrics import metrics
+from .pagination import FeedPagination, FollowPagination, RecipePagination
+from .parsers import ImageUploadParser
+from .representations import recipe_representations, recipe_rows
 
 User = get_user_model()
 
 
-class IngredientsViewSet(ListOneMixin):
+class IngredientsViewSet(CatalogCacheMixin, ListOneMixin):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
+    catalog = INGREDIENTS
+
+    def get_catalog_payload(self, request, *args, **kwargs):
+        name = request.query_params.get(api_settings.SEARCH_PARAM)
+        if not name:
+            return super().get_catalog_payload(request, *args, **kwargs)
+        return ingredient_index.search(name)
 
 
-class TagViewSet(ListOneMixin):
+class TagViewSet(CatalogCacheMixin, ListOneMixin):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    catalog = TAGS
 
 
 class RecipeViewSet(CreateListDeleteViewSet):
@@ -46,45 +69,116 @@ class RecipeViewSet(CreateListDeleteViewSet):
     permission_classes = (OwnerOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = LimitOffsetPagination
+    pagination_class = RecipePagination
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeSerializerCreate
+        if self.action == 'image':
+            return RecipeImageSerializer
         return RecipeSerializer
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
-        return queryset.add_flags(self.request.user.id)
+        return Recipe.objects.with_related()
+
+    def list_rows(self, queryset):
+        rows = recipe_rows(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(
+                recipe_representations(page, self.request))
+        return Response(recipe_representations(rows, self.request))
+
+    def list(self, request, *args, **kwargs):
+        return self.list_rows(self.filter_queryset(self.get_queryset()))
+
+    @action(detail=False)
+    def trending(self, request):
+        return self.list_rows(
+            self.filter_queryset(self.get_queryset())
+            .filter(popularity__gt=0)
+            .order_by(*POPULAR_ORDERING))
+
+    def retrieve(self, request, *args, **kwargs):
+        rows = recipe_rows(self.filter_queryset(self.get_queryset()))
+        row = generics.get_object_or_404(rows, pk=self.kwargs['pk'])
+        return Response(recipe_representations([row], request)[0])
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        page = self.paginate_queryset(feed_sources(request.user.id))
+        rows = {row['id']: row for row in recipe_rows(
+            Recipe.objects.filter(id__in=[
+                entry['recipe_id'] for entry in page]))}
+        # A recipe deleted since the page was read has no row any more.
+        rows = [rows[entry['recipe_id']] for entry in page
+                if entry['recipe_id'] in rows]
+        return self.get_paginated_response(
+            recipe_representations(rows, request))
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        recipe = generics.get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        limit = get_recipes_limit(request) or settings.SIMILAR_RECIPES_COUNT
+        neighbour_ids = list(recipe.neighbours
+                             .order_by('-score', 'neighbour_id')
+                             .values_list('neighbour_id', flat=True)[:limit])
+        rows = {row['id']: row for row in recipe_rows(
+            Recipe.objects.filter(id__in=neighbour_ids))}
+        return Response(recipe_representations(
+            [rows[recipe_id] for recipe_id in neighbour_ids
+             if recipe_id in rows], request))
+
+    @action(detail=True, methods=['put'], parser_classes=(ImageUploadParser,))
+    def image(self, request, pk=None):
+        serializer = self.get_serializer(
+            self.get_object(), data={'image': request.data.get('file')})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
 
 class RecipeIngridientsViewSet(CreateListDeleteViewSet):
     queryset = RecipeIngridient.objects.all()
     serializer_class = RecipeIngridientsSerializer
     permission_classes = (AllowAny,)
 
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        publish_change(removed=[(instance.ingredient_id, instance.recipe_id)])
+        Recipe.objects.filter(pk=instance.recipe_id).mark_neighbours_stale()
+        recipe_ingredients_removed([instance])
+
+
+@api_view()
+@permission_classes([IsAuthenticated, ])
+def shopping_cart(request):
+    cart = (request.user.cart_ingredients
+            .select_related('ingredient')
+            .order_by('ingredient__name'))
+    return Response(CartIngredientSerializer(cart, many=True).data)
+
 
 @api_view()
 @permission_classes([IsAuthenticated, ])
 def shopping_list_file(request):
-    recipes = list(request.user.shopping_list.all()
-                   .values_list('recipe', flat=True))
-    ingridients = (RecipeIngridient.objects.all()
-                   .filter(recipe__in=recipes)
-                   .values('ingredient').annotate(amount=Sum('amount')))
-
-    filename = "my-file.txt"
-    content = ""
-    for line in ingridients:
-        ingredient_id = line.get('ingredient')
-        ingridient = get_object_or_404(Ingredient, id=ingredient_id)
-        line.get('ingredient')
-        m_unit = ingridient.measurement_unit
-        content += f'{ingridient.name}  {m_unit}  {line.get("amount")} \n'
-    response = HttpResponse(content, content_type='text/plain')
+    file_type = request.query_params.get('type', 'txt')
+    if file_type not in EXPORTERS:
+        return Response(
+            {'type': [f'Допустимые форматы: {", ".join(EXPORTERS)}']},
+            status=status.HTTP_400_BAD_REQUEST)
+    exporter, content_type = EXPORTERS[file_type]
+    content = exporter(shopping_list_lines(request.user))
+    filename = f'shopping_list.{file_type}'
+    if file_type == 'pdf':
+        return FileResponse(content, as_attachment=True, filename=filename,
+                            content_type=content_type)
+    response = StreamingHttpResponse(content, content_type=content_type)
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
 
@@ -101,33 +195,52 @@ class FavoriteViewSet(ShoppingFavoriteMixin):
     queryset = Favorite.objects.all()
 
 
+class ShoppingListBatchViewSet(BatchShoppingFavoriteMixin):
+    model = ShoppingList
+    serializer_class = RecipeIdsSerializer
+
+
+class FavoriteBatchViewSet(BatchShoppingFavoriteMixin):
+    model = Favorite
+    serializer_class = RecipeIdsSerializer
+
+
 class UserViewSet(views.UserViewSet):
+    queryset = User.objects.order_by('id')
 
-    def get_queryset(self):
-        user_id = self.request.user.id
-        return self.queryset.all().annotate(
-            is_subscribed=Exists(
-                Follow.objects.filter(
-                    user_id=user_id, author__id=OuterRef('id')
-                )
-            )
-        )
+    # request.user may come from the token cache with stale counters, so
+    # views that show or save the whole user work on a fresh instance.
+    def get_instance(self):
+        return User.objects.get(pk=self.request.user.pk)
+
+    @action(['post'], detail=False)
+    def set_password(self, request, *args, **kwargs):
+        request.user = self.get_instance()
+        return super().set_password(request, *args, **kwargs)
 
 
 class FollowViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     model = Follow
     serializer_class = FollowSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = FollowPagination
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        return (self.request.user.follower.all()
-                .annotate(recipes_count=Count('author__recipes'))
-                .annotate(is_subscribed=Exists(
-                    Follow.objects.filter(
-                        user_id=user_id, author__id=OuterRef('id')
-                    )
-                )))
+        return self.request.user.follower.select_related('author')
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            return None
+        recipes = Recipe.objects.all()
+        recipes_limit = get_recipes_limit(self.request)
+        if recipes_limit is not None:
+            recipes = recipes.latest_per_author(
+                [follow.author_id for follow in page], recipes_limit)
+        prefetch_related_objects(page, Prefetch('author__recipes',
+                                                queryset=recipes,
+                                                to_attr='preview_recipes'))
+        return page
 
     def perform_create(self, serializer):
         author = get_object_or_404(User, id=self.kwargs.get('author_id'))
@@ -153,3 +266,11 @@ class FollowEditViewSet(CreateDestroyMixin):
         instance = get_object_or_404(Follow, author=author, user=user)
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def request_metrics(request):
+    """Prometheus scrape target; served outside /api/ so nginx hides it."""
+    if not settings.REQUEST_METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -30,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +71,20 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='')
+    }
+}
+
+# Relation id sets (three per user), token and catalog versions share the
+# default cache; LocMemCache would start culling them at 300 entries.
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=100000)),
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,13 +117,63 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 6000
+RECIPE_IMAGE_QUALITY = 85
+RECIPE_IMAGE_SIZES = {
+    'small': 320,
+    'medium': 800,
+}
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+CATALOG_CACHE_TTL = 300
+CATALOG_CACHE_SIZE = 256
+RECIPE_INDEX_MAX_CHANGES = 1000
+RECIPE_INDEX_MAX_IDS = 1000
+
+RELATIONS_CACHE_TTL = 60 * 60
+RELATIONS_LOCAL_CACHE_TTL = 5
+BATCH_RECIPES_LIMIT = 100
+
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_FANOUT_RESUME_FOLLOWERS = FEED_FANOUT_MAX_FOLLOWERS * 9 // 10
+FEED_FANOUT_BATCH_SIZE = 1000
+
+SIMILAR_RECIPES_COUNT = 10
+
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_FAVORITE_WEIGHT = 1.0
+POPULARITY_CART_WEIGHT = 0.5
+
+TOKEN_CACHE_TTL = 5 * 60
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='False') == 'True'
+
+REQUEST_METRICS_ENABLED = os.getenv('REQUEST_METRICS_ENABLED',
+                                    default='False') == 'True'
+REQUEST_METRICS_SLOW_MS = int(os.getenv('REQUEST_METRICS_SLOW_MS',
+                                        default=500))
+REQUEST_METRICS_SLOW_QUERIES = 3
+REQUEST_METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1,
+                           0.25, 0.5, 1, 2.5, 5, 10)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
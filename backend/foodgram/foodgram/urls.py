@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from api.views import request_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls, name='admin'),
     path('api/', include('api.urls')),
+    path('metrics/', request_metrics, name='metrics'),
 
 ]
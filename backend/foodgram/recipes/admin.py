@@ -1,16 +1,44 @@
 from django.contrib import admin
 
-from .models import (Favorite, Follow, Ingredient, Recipe,
-                     RecipeIngridient, ShoppingList, Tag)
+from .cart import recipe_ingredients_changed, recipe_ingredients_removed
+from .models import (CartIngredient, Favorite, Follow, Ingredient, Recipe,
+                     RecipeIngridient, ShoppingList, Tag, TimelineEntry)
+from .recipe_index import publish_change
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author')
+    list_display = ('id', 'name', 'author',
+                    'favorites_count', 'shopping_cart_count')
     list_filter = ('author', 'name', 'tags')
-    readonly_fields = ('in_favorite',)
-
-    def in_favorite(self, obj):
-        return len(obj.favorites.all())
+    list_select_related = ('author',)
+    readonly_fields = ('favorites_count', 'shopping_cart_count')
+
+
+class RecipeIngridientAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        previous = (RecipeIngridient.objects.get(pk=obj.pk)
+                    if change else None)
+        super().save_model(request, obj, form, change)
+        if previous is not None:
+            recipe_ingredients_removed([previous])
+            recipe_ingredients_changed(
+                obj.recipe_id, {obj.ingredient_id: obj.amount})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        publish_change(removed=[(obj.ingredient_id, obj.recipe_id)])
+        Recipe.objects.filter(pk=obj.recipe_id).mark_neighbours_stale()
+        recipe_ingredients_removed([obj])
+
+    def delete_queryset(self, request, queryset):
+        removed = list(queryset.only('recipe_id', 'ingredient_id', 'amount'))
+        super().delete_queryset(request, queryset)
+        publish_change(removed=[(row.ingredient_id, row.recipe_id)
+                                for row in removed])
+        Recipe.objects.filter(
+            id__in=[row.recipe_id for row in removed]
+        ).mark_neighbours_stale()
+        recipe_ingredients_removed(removed)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -21,7 +49,9 @@ class IngredientAdmin(admin.ModelAdmin):
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(RecipeIngridient)
+admin.site.register(RecipeIngridient, RecipeIngridientAdmin)
 admin.site.register(Follow)
 admin.site.register(ShoppingList)
 admin.site.register(Favorite)
+admin.site.register(CartIngredient)
+admin.site.register(TimelineEntry)
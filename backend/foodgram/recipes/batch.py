@@ -0,0 +1,87 @@
+from django.db import connection, transaction
+
+from users.models import User
+from .cart import apply_cart_deltas, recipe_amounts
+from .counters import change_counter
+from .models import Favorite, Recipe, ShoppingList
+from .relations import FAVORITES, SHOPPING_CART, invalidate_relation
+
+# bulk_create and plain SQL deletes skip the model signals, so the batch paths
+# repeat their bookkeeping here once per batch instead of once per row.
+BATCH_RELATIONS = {
+    Favorite: (FAVORITES, 'favorites_count'),
+    ShoppingList: (SHOPPING_CART, 'shopping_cart_count'),
+}
+
+
+def existing_recipes(recipe_ids):
+    return set(Recipe.objects.filter(id__in=recipe_ids)
+               .values_list('id', flat=True))
+
+
+def lock_user(user_id):
+    """Serialize batch changes of one user's favorites and cart until the
+    end of the transaction."""
+    list(User.objects.select_for_update().filter(pk=user_id)
+         .values_list('id', flat=True))
+
+
+def invalidate_on_commit(relation, user_id):
+    # Dropping the cached ids before the commit would let a concurrent
+    # request cache the old set again for RELATIONS_CACHE_TTL.
+    transaction.on_commit(lambda: invalidate_relation(relation, [user_id]))
+
+
+def related_recipes(model, user_id, recipe_ids):
+    return set(model.objects.filter(user_id=user_id, recipe_id__in=recipe_ids)
+               .values_list('recipe_id', flat=True))
+
+
+def delete_related(model, user_id, recipe_ids):
+    """Delete the user's rows with one statement and without signals."""
+    recipe_ids = list(recipe_ids)
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} '
+            f'WHERE user_id = %s AND recipe_id IN ({placeholders})',
+            [user_id, *recipe_ids])
+
+
+@transaction.atomic
+def add_recipes(model, user_id, recipe_ids):
+    """Add the recipes to the user's favorites or cart; returns the ids
+    that were not there yet."""
+    relation, counter = BATCH_RELATIONS[model]
+    lock_user(user_id)
+    present = related_recipes(model, user_id, recipe_ids)
+    added = [recipe_id for recipe_id in recipe_ids if recipe_id not in present]
+    if not added:
+        return set()
+    # The single-recipe endpoints take the same lock, so nothing else can
+    # insert these rows before the batch does.
+    model.objects.bulk_create(
+        model(user_id=user_id, recipe_id=recipe_id) for recipe_id in added)
+    change_counter(Recipe, added, counter, 1)
+    if model is ShoppingList:
+        apply_cart_deltas([user_id], recipe_amounts(added))
+    invalidate_on_commit(relation, user_id)
+    return set(added)
+
+
+@transaction.atomic
+def remove_recipes(model, user_id, recipe_ids):
+    """Remove the recipes from the user's favorites or cart; returns the
+    ids that were there."""
+    relation, counter = BATCH_RELATIONS[model]
+    lock_user(user_id)
+    removed = related_recipes(model, user_id, recipe_ids)
+    if not removed:
+        return set()
+    if model is ShoppingList:
+        apply_cart_deltas([user_id], recipe_amounts(removed, sign=-1))
+    # Nothing cascades from these tables, so a plain DELETE is safe.
+    delete_related(model, user_id, removed)
+    change_counter(Recipe, removed, counter, -1)
+    invalidate_on_commit(relation, user_id)
+    return removed
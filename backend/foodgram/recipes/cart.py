@@ -0,0 +1,102 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import CartIngredient, RecipeIngridient, ShoppingList
+
+
+def recipe_amounts(recipe_ids, sign=1):
+    """Ingredient totals of the given recipes, multiplied by ``sign``."""
+    rows = (RecipeIngridient.objects
+            .filter(recipe_id__in=recipe_ids)
+            .values('ingredient_id')
+            .annotate(total=Sum('amount'))
+            .values_list('ingredient_id', 'total'))
+    return {ingredient_id: sign * total for ingredient_id, total in rows}
+
+
+@transaction.atomic
+def apply_cart_deltas(user_ids, deltas):
+    """Add ``deltas`` ({ingredient id: amount}) to the carts of all users."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas or not user_ids:
+        return
+    existing = {
+        (row.user_id, row.ingredient_id): row
+        for row in CartIngredient.objects.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=deltas)
+    }
+    changed, removed, created = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, delta in deltas.items():
+            row = existing.get((user_id, ingredient_id))
+            if row is None:
+                if delta > 0:
+                    created.append(CartIngredient(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=delta))
+            elif row.amount + delta > 0:
+                row.amount += delta
+                changed.append(row)
+            else:
+                removed.append(row.id)
+    if changed:
+        CartIngredient.objects.bulk_update(changed, ['amount'])
+    if removed:
+        CartIngredient.objects.filter(id__in=removed).delete()
+    CartIngredient.objects.bulk_create(created)
+
+
+def recipe_ingredients_changed(recipe_id, deltas):
+    """Propagate an ingredient diff of a recipe to every cart holding it."""
+    if not any(deltas.values()):
+        return
+    user_ids = list(ShoppingList.objects.filter(recipe_id=recipe_id)
+                    .values_list('user_id', flat=True))
+    apply_cart_deltas(user_ids, deltas)
+
+
+def recipe_ingredients_removed(recipe_ingredients):
+    """Subtract deleted ``RecipeIngridient`` rows from the carts."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for row in recipe_ingredients:
+        deltas[row.recipe_id][row.ingredient_id] -= row.amount
+    for recipe_id, recipe_deltas in deltas.items():
+        recipe_ingredients_changed(recipe_id, recipe_deltas)
+
+
+def actual_totals():
+    rows = (RecipeIngridient.objects
+            .filter(recipe__shop_list__isnull=False)
+            .values('recipe__shop_list__user_id', 'ingredient_id')
+            .annotate(total=Sum('amount'))
+            .values_list('recipe__shop_list__user_id', 'ingredient_id',
+                         'total'))
+    return {(user_id, ingredient_id): total
+            for user_id, ingredient_id, total in rows.iterator()}
+
+
+def rebuild_cart_totals(fix=True):
+    """Compare stored cart totals with the cart contents and repair drift.
+
+    Returns the number of users whose totals drifted.
+    """
+    actual = actual_totals()
+    stored = {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in CartIngredient.objects
+        .values_list('user_id', 'ingredient_id', 'amount').iterator()
+    }
+    drifted = {key[0] for key in actual.keys() | stored.keys()
+               if actual.get(key) != stored.get(key)}
+    if fix and drifted:
+        with transaction.atomic():
+            CartIngredient.objects.filter(user_id__in=drifted).delete()
+            CartIngredient.objects.bulk_create(
+                CartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                               amount=total)
+                for (user_id, ingredient_id), total in actual.items()
+                if user_id in drifted
+            )
+    return len(drifted)
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+RECIPE_INGREDIENTS = 'recipe_ingredients'
+
+
+def default_cache_is_shared():
+    """Whether a value written by one worker process is seen by the
+    others."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def version_key(catalog):
+    return f'catalog-version:{catalog}'
+
+
+def get_version(catalog):
+    """Current version of a catalog, shared through the default cache."""
+    version = cache.get(version_key(catalog))
+    if version is not None:
+        return version
+    cache.add(version_key(catalog), time.time_ns(), None)
+    return cache.get(version_key(catalog))
+
+
+def bump_version(catalog):
+    """Move a catalog to its next version and return it."""
+    try:
+        return cache.incr(version_key(catalog))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(version_key(catalog), version, None)
+        return version
+
+
+class CatalogSnapshot:
+    """In-process data built from the database for one catalog.
+
+    The data is brought up to date when the catalog version changes,
+    through ``catch_up`` when the subclass can apply the changes in place,
+    otherwise by a full rebuild. CATALOG_CACHE_TTL bounds how long a worker
+    may keep a copy when the version is not shared between processes.
+    """
+    catalog = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def catch_up(self, data, version, current):
+        """Data moved from ``version`` to ``current`` without a rebuild, or
+        None when the changes in between are not known."""
+
+    def _is_recent(self, snapshot):
+        return (snapshot is not None
+                and time.monotonic() - snapshot[1]
+                <= settings.CATALOG_CACHE_TTL)
+
+    def _is_fresh(self, snapshot, version):
+        return self._is_recent(snapshot) and snapshot[0] == version
+
+    def _refresh(self, snapshot, version):
+        if self._is_recent(snapshot):
+            data = self.catch_up(snapshot[2], snapshot[0], version)
+            if data is not None:
+                return (version, snapshot[1], data)
+        return (version, time.monotonic(), self.build())
+
+    def get_data(self):
+        version = get_version(self.catalog)
+        snapshot = self._snapshot
+        if not self._is_fresh(snapshot, version):
+            with self._lock:
+                if not self._is_fresh(self._snapshot, version):
+                    self._snapshot = self._refresh(self._snapshot, version)
+                snapshot = self._snapshot
+        return snapshot[2]
@@ -0,0 +1,43 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import User
+from .models import Favorite, Follow, Recipe, ShoppingList
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counter(model, pks, field, delta):
+    model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def actual_count(related_model, related_field):
+    counts = (related_model.objects
+              .filter(**{related_field: OuterRef('pk')})
+              .order_by()
+              .values(related_field)
+              .annotate(count=Count('pk'))
+              .values('count'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount(fix=True):
+    """Compare every counter with the real row count and repair drift.
+
+    Returns a list of (model, field, drifted rows) tuples.
+    """
+    drift = []
+    for model, field, related_model, related_field in COUNTERS:
+        actual = actual_count(related_model, related_field)
+        drifted = (model.objects.annotate(actual=actual)
+                   .exclude(**{field: F('actual')})
+                   .count())
+        drift.append((model, field, drifted))
+        if fix and drifted:
+            model.objects.update(**{field: actual})
+    return drift
@@ -0,0 +1,149 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from users.models import User
+from .models import Follow, Recipe, TimelineEntry
+
+
+# Recipes of authors with feed_on_demand are not copied into timelines on
+# publish; the feed reads them from the recipes table instead. Authors are
+# switched on when they reach FEED_FANOUT_MAX_FOLLOWERS and only switched
+# back offline, by rebuild_timelines, once they fall below
+# FEED_FANOUT_RESUME_FOLLOWERS: an unfollow never copies a popular author's
+# recipes into every timeline inside the request.
+def on_demand_authors(author_ids):
+    """The authors among ``author_ids`` whose recipes are read on demand."""
+    on_demand, reached = set(), []
+    rows = (User.objects.filter(pk__in=author_ids)
+            .values_list('id', 'followers_count', 'feed_on_demand'))
+    for author_id, followers, flag in rows:
+        if flag or followers >= settings.FEED_FANOUT_MAX_FOLLOWERS:
+            on_demand.add(author_id)
+            if not flag:
+                reached.append(author_id)
+    if reached:
+        User.objects.filter(pk__in=reached).update(feed_on_demand=True)
+    return on_demand
+
+
+def reads_on_demand(author_id):
+    return author_id in on_demand_authors([author_id])
+
+
+def write_entries(entries):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, settings.FEED_FANOUT_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipes):
+    """Copy new recipes into the timelines of their authors' followers."""
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    pushed = by_author.keys() - on_demand_authors(list(by_author))
+    if not pushed:
+        return
+    follows = (Follow.objects.filter(author_id__in=pushed)
+               .values_list('user_id', 'author_id'))
+    write_entries(
+        TimelineEntry(user_id=user_id, recipe_id=recipe.id,
+                      pub_date=recipe.pub_date)
+        for user_id, author_id in follows.iterator()
+        for recipe in by_author[author_id])
+
+
+def backfill(user_ids, author_id):
+    """Copy all recipes of an author into the given timelines."""
+    recipes = list(Recipe.objects.filter(author_id=author_id)
+                   .values_list('id', 'pub_date'))
+    write_entries(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+        for user_id in user_ids
+        for recipe_id, pub_date in recipes)
+
+
+def add_author(user_id, author_id):
+    if not reads_on_demand(author_id):
+        backfill([user_id], author_id)
+
+
+def remove_author(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+def feed_sources(user_id):
+    """Querysets of (pub_date, recipe_id) rows that make up a user's feed."""
+    timeline = (TimelineEntry.objects.filter(user_id=user_id)
+                .values('pub_date', 'recipe_id'))
+    popular = (Follow.objects.filter(user_id=user_id,
+                                     author__feed_on_demand=True)
+               .values_list('author_id', flat=True))
+    read_on_demand = (Recipe.objects.filter(author_id__in=list(popular))
+                      .annotate(recipe_id=F('id'))
+                      .values('pub_date', 'recipe_id'))
+    return timeline, read_on_demand
+
+
+def expected_entries():
+    rows = (Follow.objects
+            .filter(author__feed_on_demand=False)
+            .values_list('user_id', 'author__recipes__id',
+                         'author__recipes__pub_date'))
+    return {(user_id, recipe_id): pub_date
+            for user_id, recipe_id, pub_date in rows.iterator()
+            if recipe_id is not None}
+
+
+def switch_authors():
+    """Move authors between pushed and on-demand recipes by their current
+    follower counts; the timelines are repaired afterwards."""
+    User.objects.filter(
+        feed_on_demand=False,
+        followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).update(feed_on_demand=True)
+    User.objects.filter(
+        feed_on_demand=True,
+        followers_count__lt=settings.FEED_FANOUT_RESUME_FOLLOWERS,
+    ).update(feed_on_demand=False)
+
+
+@transaction.atomic
+def rebuild_timelines(fix=True):
+    """Compare timelines with the follows and repair drift.
+
+    With ``fix`` authors are switched between pushed and on-demand recipes
+    first, which backfills the timelines of authors that lost followers.
+    Returns the number of users whose timeline drifted.
+    """
+    if fix:
+        switch_authors()
+    expected = expected_entries()
+    # Entries copied before an author switched to on-demand reads are
+    # left in place; the feed merge skips the duplicates.
+    stored = {
+        (user_id, recipe_id): pub_date
+        for user_id, recipe_id, pub_date in TimelineEntry.objects
+        .filter(recipe__author__feed_on_demand=False)
+        .values_list('user_id', 'recipe_id', 'pub_date').iterator()
+    }
+    drifted = {key[0] for key in expected.keys() | stored.keys()
+               if expected.get(key) != stored.get(key)}
+    if fix and drifted:
+        TimelineEntry.objects.filter(user_id__in=drifted).delete()
+        write_entries(
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                          pub_date=pub_date)
+            for (user_id, recipe_id), pub_date in expected.items()
+            if user_id in drifted
+        )
+    return len(drifted)
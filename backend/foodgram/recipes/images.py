@@ -0,0 +1,107 @@
+import io
+import os
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image
+
+VARIANTS_DIR = 'variants'
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+}
+
+
+def open_image(source):
+    """Open an upload after checking its dimensions from the header only."""
+    try:
+        image = Image.open(source)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError('Файл не является изображением')
+    width, height = image.size
+    max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+    if width > max_dimension or height > max_dimension:
+        raise ValidationError(
+            f'Размер изображения не должен превышать '
+            f'{max_dimension}x{max_dimension} пикселей')
+    try:
+        image.load()
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError('Изображение повреждено')
+    return image
+
+
+def to_rgb(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format,
+               quality=settings.RECIPE_IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def process_image(source):
+    """Validate an uploaded image and re-encode it as a JPEG file."""
+    image = to_rgb(open_image(source))
+    return ContentFile(encode(image, 'JPEG'), name=f'{uuid.uuid4().hex}.jpg')
+
+
+def variant_name(name, size, extension):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, VARIANTS_DIR,
+                        f'{stem}_{size}.{extension}')
+
+
+def variant_names(name):
+    return {
+        size: {
+            variant: variant_name(name, size, extension)
+            for variant, (_, extension) in VARIANT_FORMATS.items()
+        }
+        for size in settings.RECIPE_IMAGE_SIZES
+    }
+
+
+def delete_image(storage, name):
+    """Remove a stored image together with its thumbnails."""
+    for variants in variant_names(name).values():
+        for variant in variants.values():
+            storage.delete(variant)
+    storage.delete(name)
+
+
+def ensure_variants(image_field, force=False):
+    """Write the thumbnails of a stored image that do not exist yet."""
+    storage = image_field.storage
+    names = variant_names(image_field.name)
+    missing = [
+        (size, variant, name)
+        for size, variants in names.items()
+        for variant, name in variants.items()
+        if force or not storage.exists(name)
+    ]
+    if not missing:
+        return
+    try:
+        with storage.open(image_field.name) as file:
+            original = to_rgb(Image.open(file))
+    except OSError:
+        return
+    for size, variant, name in missing:
+        thumbnail = original.copy()
+        box = settings.RECIPE_IMAGE_SIZES[size]
+        thumbnail.thumbnail((box, box), Image.LANCZOS)
+        if force:
+            storage.delete(name)
+        storage.save(name, ContentFile(
+            encode(thumbnail, VARIANT_FORMATS[variant][0])))
@@ -0,0 +1,46 @@
+import bisect
+import heapq
+
+from django.conf import settings
+
+from .catalog import INGREDIENTS, CatalogSnapshot
+
+PREFIX_END = '\U0010ffff'
+
+
+class IngredientIndex(CatalogSnapshot):
+    """Sorted in-process copy of the ingredient catalog for autocomplete."""
+    catalog = INGREDIENTS
+
+    def build(self):
+        from .models import Ingredient
+
+        rows = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit').iterator()
+        entries = sorted(
+            (name.lower(), id, {'id': id,
+                                'name': name,
+                                'measurement_unit': measurement_unit})
+            for id, name, measurement_unit in rows
+        )
+        keys = [entry[0] for entry in entries]
+        return keys, entries
+
+    def search(self, prefix, limit=None):
+        keys, entries = self.get_data()
+        prefix = prefix.lower()
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + PREFIX_END, start)
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        if end - start <= limit:
+            positions = range(start, end)
+        else:
+            positions = heapq.nsmallest(
+                limit, range(start, end),
+                key=lambda position: (len(keys[position]), position))
+        ranked = sorted(positions,
+                        key=lambda position: (len(keys[position]), position))
+        return [entries[position][2] for position in ranked]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,265 @@
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.counters import recount
+from recipes.cart import rebuild_cart_totals
+from recipes.feed import rebuild_timelines
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngridient, ShoppingList, Tag)
+from recipes.popularity import update_popularity
+from users.models import User
+
+TAGS_COUNT = 8
+# Process-local cache so runs neither read nor pollute a shared cache.
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def endpoints(author, recipe, tag, prefix):
+    return {
+        'recipes': ('/api/recipes/', {'limit': 6}),
+        'recipes page of 100': ('/api/recipes/', {'limit': 100}),
+        'recipes deep page': ('/api/recipes/', {'limit': 6, 'offset': 600}),
+        'recipes by tag': ('/api/recipes/', {'limit': 6, 'tags': tag.slug}),
+        'recipes by author': ('/api/recipes/',
+                              {'limit': 6, 'author': author.id}),
+        'favorites': ('/api/recipes/', {'limit': 6, 'is_favorited': 1}),
+        'feed': ('/api/recipes/feed/', {'limit': 6}),
+        'trending': ('/api/recipes/trending/', {'limit': 6}),
+        'trending by tag': ('/api/recipes/trending/',
+                            {'limit': 6, 'tags': tag.slug}),
+        'recipe': (f'/api/recipes/{recipe.id}/', {}),
+        'subscriptions': ('/api/users/subscriptions/',
+                          {'limit': 6, 'recipes_limit': 3}),
+        'shopping list': ('/api/recipes/download_shopping_cart/', {}),
+        'ingredients search': ('/api/ingredients/', {'name': prefix}),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Строит синтетический набор данных во временной базе и замеряет '
+            'время ответа и число SQL-запросов основных эндпоинтов API. '
+            'Для замеров на SQLite запускайте с '
+            'DB_ENGINE=django.db.backends.sqlite3')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=1000,
+                            help='Размер справочника ингредиентов')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--cart', type=int, default=10,
+                            help='Рецептов в списке покупок на пользователя')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', nargs='+', metavar='ENDPOINT',
+                            help='Замерить только указанные эндпоинты')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', metavar='FILE',
+                            help='Сравнить с результатами прошлого запуска')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 2:
+            raise CommandError('Нужно хотя бы две итерации')
+        if options['follows'] >= options['users']:
+            raise CommandError('Подписок должно быть меньше пользователей')
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        self.report(results, previous)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def run(self, options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            self.build_dataset(random.Random(options['seed']), options)
+        self.stdout.write(
+            f'Данные созданы за {time.perf_counter() - started:.1f} с')
+
+        user = User.objects.order_by('id').first()
+        author = User.objects.order_by('-recipes_count', 'id').first()
+        recipe = Recipe.objects.order_by('id').first()
+        tag = Tag.objects.order_by('id').first()
+        prefix = Ingredient.objects.order_by('id').first().name[:3]
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+        selected = endpoints(author, recipe, tag, prefix)
+        if options['only']:
+            unknown = set(options['only']) - selected.keys()
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}')
+            selected = {name: selected[name] for name in options['only']}
+
+        measured = {}
+        for name, (url, params) in selected.items():
+            measured[name] = self.measure(client, url, params, options)
+        return {
+            'created': now().isoformat(),
+            'vendor': connection.vendor,
+            'dataset': {key: options[key] for key in (
+                'users', 'recipes', 'ingredients', 'ingredients_per_recipe',
+                'favorites', 'cart', 'follows', 'seed')},
+            'iterations': options['iterations'],
+            'endpoints': measured,
+        }
+
+    def build_dataset(self, rng, options):
+        password = make_password('benchmark')
+        User.objects.bulk_create((
+            User(username=f'user{number}', email=f'user{number}@example.com',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for number in range(options['users'])
+        ))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тэг {number}', slug=f'tag{number}', color='#49B64E')
+            for number in range(TAGS_COUNT)
+        )
+        Ingredient.objects.bulk_create((
+            Ingredient(name=f'ингредиент {number}',
+                       measurement_unit=rng.choice(('г', 'мл', 'шт')))
+            for number in range(options['ingredients'])
+        ))
+        user_ids = list(User.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+
+        start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        recipes = [
+            Recipe(author_id=rng.choice(user_ids), name=f'Рецепт {number}',
+                   text='Описание рецепта ' * 20,
+                   cooking_time=rng.randint(5, 120),
+                   image='recipes/benchmark.jpg')
+            for number in range(options['recipes'])
+        ]
+        Recipe.objects.bulk_create(recipes)
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        # auto_now_add gives every row the same pub_date; spread them out.
+        Recipe.objects.bulk_update([
+            Recipe(id=recipe_id, pub_date=start + timedelta(minutes=number))
+            for number, recipe_id in enumerate(recipe_ids)
+        ], ['pub_date'])
+
+        per_recipe = min(options['ingredients_per_recipe'],
+                         len(ingredient_ids))
+        Recipe.tags.through.objects.bulk_create((
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 3))
+        ))
+        RecipeIngridient.objects.bulk_create((
+            RecipeIngridient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(ingredient_ids, per_recipe)
+        ))
+        for model, count in ((Favorite, options['favorites']),
+                             (ShoppingList, options['cart'])):
+            count = min(count, len(recipe_ids))
+            model.objects.bulk_create((
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in rng.sample(recipe_ids, count)
+            ))
+        Follow.objects.bulk_create((
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in rng.sample(
+                [other for other in user_ids if other != user_id],
+                options['follows'])
+        ))
+        recount(fix=True)
+        rebuild_cart_totals(fix=True)
+        rebuild_timelines(fix=True)
+        update_popularity()
+
+    def request(self, client, url, params):
+        response = client.get(url, params)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def measure(self, client, url, params, options):
+        for _ in range(options['warmup']):
+            self.request(client, url, params)
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            self.request(client, url, params)
+        timings = []
+        for _ in range(options['iterations']):
+            started = time.perf_counter()
+            self.request(client, url, params)
+            timings.append((time.perf_counter() - started) * 1000)
+        quantiles = statistics.quantiles(timings, n=100, method='inclusive')
+        return {
+            'url': url,
+            'params': params,
+            'queries': queries.count,
+            'min_ms': round(min(timings), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'p50_ms': round(quantiles[49], 3),
+            'p90_ms': round(quantiles[89], 3),
+            'p99_ms': round(quantiles[98], 3),
+            'max_ms': round(max(timings), 3),
+        }
+
+    def report(self, results, previous):
+        previous_endpoints = (previous or {}).get('endpoints', {})
+        self.stdout.write(f'{"эндпоинт":<22}{"SQL":>5}{"p50, мс":>10}'
+                          f'{"p90, мс":>10}{"p99, мс":>10}')
+        for name, result in results['endpoints'].items():
+            line = (f'{name:<22}{result["queries"]:>5}'
+                    f'{result["p50_ms"]:>10.2f}{result["p90_ms"]:>10.2f}'
+                    f'{result["p99_ms"]:>10.2f}')
+            before = previous_endpoints.get(name)
+            if before:
+                change = (result['p50_ms'] / before['p50_ms'] - 1) * 100
+                line += (f'  p50 {change:+.0f}%, '
+                         f'SQL {result["queries"] - before["queries"]:+d}')
+            self.stdout.write(line)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import ensure_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии и WebP-версии изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать уже существующие копии')
+
+    def handle(self, *args, **options):
+        processed = 0
+        recipes = (Recipe.objects.exclude(image='').exclude(image=None)
+                   .only('id', 'image').iterator())
+        for recipe in recipes:
+            ensure_variants(recipe.image, force=options['force'])
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}'))
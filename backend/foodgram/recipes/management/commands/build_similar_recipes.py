@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import refresh_neighbours
+
+
+class Command(BaseCommand):
+    help = ('Находит похожие по ингредиентам рецепты (индекс Жаккара). '
+            'По умолчанию пересчитывает только рецепты, чьи ингредиенты '
+            'изменились, и рецепты, которых это затронуло')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать похожие для всех рецептов')
+        parser.add_argument('--count', type=int,
+                            default=settings.SIMILAR_RECIPES_COUNT,
+                            help='Сколько похожих рецептов хранить')
+        parser.add_argument('--batch-size', type=int, default=256,
+                            help='Рецептов в одной пачке')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        refreshed = refresh_neighbours(
+            options['count'], options['batch_size'], full=options['full'],
+            progress=self.progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлены похожие рецепты: {refreshed} '
+            f'за {time.perf_counter() - started:.1f} с'))
+
+    def progress(self, done, total):
+        self.stdout.write(f'{done}/{total}')
@@ -0,0 +1,86 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.models import CartIngredient, Recipe, Tag
+from users.models import User
+
+SEQUENTIAL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+# The unfiltered feed is expected to walk recipes in index order.
+ORDERED_SCANS = {
+    'recipes': {Recipe._meta.db_table},
+}
+
+
+def main_queries(user, author, tag, limit):
+    recipes = Recipe.objects.select_related('author')
+    return {
+        'recipes': recipes[:limit],
+        'recipes by author': recipes.filter(author=author)[:limit],
+        'recipes by tag': recipes.filter(tags__slug=tag.slug)[:limit],
+        'favorites': recipes.filter(favorites__user=user)[:limit],
+        'shopping cart': recipes.filter(shop_list__user=user)[:limit],
+        'subscriptions': user.follower.select_related('author')[:limit],
+        'author recipes': Recipe.objects.latest_per_author([author.id], 3),
+        'shopping list': (CartIngredient.objects
+                          .filter(user=user)
+                          .values('ingredient__name',
+                                  'ingredient__measurement_unit', 'amount')
+                          .order_by('ingredient__name')),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные запросы API через EXPLAIN и завершается '
+            'с ошибкой при последовательном сканировании больших таблиц')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Таблицы меньшего размера не проверяются')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def large_tables(self, min_rows):
+        tables = set()
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+                )
+                if cursor.fetchone()[0] >= min_rows:
+                    tables.add(table)
+        return tables
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'СУБД {connection.vendor} не поддерживается')
+        user = User.objects.filter(follower__isnull=False).first()
+        author = User.objects.order_by('-recipes_count').first()
+        tag = Tag.objects.first()
+        if user is None or author is None or tag is None:
+            raise CommandError('Недостаточно данных для проверки запросов')
+
+        large_tables = self.large_tables(options['min_rows'])
+        failed = []
+        queries = main_queries(user, author, tag, options['limit'])
+        for name, queryset in queries.items():
+            plan = queryset.explain()
+            scanned = (set(pattern.findall(plan)) & large_tables
+                       - ORDERED_SCANS.get(name, set()))
+            if options['verbose_plans']:
+                self.stdout.write(f'--- {name}\n{plan}')
+            if scanned:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: полное сканирование {", ".join(sorted(scanned))}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+        if failed:
+            raise CommandError(
+                f'Полное сканирование в запросах: {", ".join(failed)}')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import Progress, export_recipes
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с авторами, тэгами и ингредиентами в формате '
+            'NDJSON: по рецепту на строку')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--with-images', action='store_true',
+                            help='Вложить файлы изображений в base64')
+
+    def handle(self, *args, **options):
+        progress = Progress(self.stderr)
+        if options['output'] == '-':
+            exported = self.export(self.stdout, progress, options)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                exported = self.export(file, progress, options)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}'))
+
+    def export(self, stream, progress, options):
+        return export_recipes(stream, options['chunk_size'],
+                              with_images=options['with_images'],
+                              progress=progress)
@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.catalog import INGREDIENTS, bump_version
+from recipes.models import Ingredient
+
+CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n,['
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, '..', '..',
+                            'data', 'ingredients.json')
+
+
+def read_json(file):
+    """Yield the items of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in iter(partial(file.read, CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while (position < len(buffer)
+                   and buffer[position] in JSON_SEPARATORS):
+                position += 1
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+    if buffer.strip(JSON_SEPARATORS + ']'):
+        raise CommandError('Некорректный JSON: ' + buffer[:100])
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if not row or row == ['name', 'measurement_unit']:
+            continue
+        yield row[0], row[1]
+
+
+READERS = {
+    'json': read_json,
+    'csv': read_csv,
+}
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из JSON или CSV файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--format', choices=READERS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        read = created = 0
+
+        with open(path, encoding='utf-8', newline='') as file:
+            with transaction.atomic():
+                seen = set(Ingredient.objects
+                           .values_list('name', 'measurement_unit')
+                           .iterator())
+                batch = []
+                for name, measurement_unit in READERS[file_format](file):
+                    read += 1
+                    key = (name.strip(), measurement_unit.strip())
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    batch.append(Ingredient(name=key[0],
+                                            measurement_unit=key[1]))
+                    if len(batch) >= batch_size:
+                        Ingredient.objects.bulk_create(batch)
+                        created += len(batch)
+                        batch = []
+                Ingredient.objects.bulk_create(batch)
+                created += len(batch)
+
+        bump_version(INGREDIENTS)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {read}, добавлено: {created} '
+            f'за {elapsed:.2f} с ({read / max(elapsed, 1e-6):.0f} строк/с)'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cart import rebuild_cart_totals
+from recipes.counters import recount
+from recipes.feed import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, покупок, рецептов и '
+            'подписчиков, суммы ингредиентов в списках покупок и ленты '
+            'подписок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        for model, field, drifted in recount(fix=not options['check']):
+            self.stdout.write(
+                f'{model._meta.label}.{field}: расхождений {drifted}')
+        drifted = rebuild_cart_totals(fix=not options['check'])
+        self.stdout.write(
+            f'Суммы списков покупок: расхождений у {drifted} пользователей')
+        drifted = rebuild_timelines(fix=not options['check'])
+        self.stdout.write(f'Ленты подписок: расхождений у {drifted} '
+                          'пользователей')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import update_popularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает популярность рецептов по добавлениям в избранное '
+            'и в списки покупок с затуханием по времени. Запускайте '
+            'периодически, например раз в час')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        changed = update_popularity(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность обновлена у рецептов: {changed}'))
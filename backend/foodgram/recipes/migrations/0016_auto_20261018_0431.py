@@ -0,0 +1,51 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_cart_totals(apps, schema_editor):
+    RecipeIngridient = apps.get_model('recipes', 'RecipeIngridient')
+    CartIngredient = apps.get_model('recipes', 'CartIngredient')
+    rows = (RecipeIngridient.objects
+            .filter(recipe__shop_list__isnull=False)
+            .values('recipe__shop_list__user_id', 'ingredient_id')
+            .annotate(total=Sum('amount'))
+            .values_list('recipe__shop_list__user_id', 'ingredient_id',
+                         'total'))
+    CartIngredient.objects.bulk_create(
+        CartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                       amount=total)
+        for user_id, ingredient_id, total in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0015_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.Ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списке покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='UniqueCartIngredient'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Follow = apps.get_model('recipes', 'Follow')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    rows = (Follow.objects
+            .filter(author__followers_count__lt=(
+                settings.FEED_FANOUT_MAX_FOLLOWERS))
+            .values_list('user_id', 'author__recipes__id',
+                         'author__recipes__pub_date'))
+    TimelineEntry.objects.bulk_create(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+        for user_id, recipe_id, pub_date in rows
+        if recipe_id is not None
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0016_auto_20261018_0431'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='date published')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.Recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='UniqueTimelineEntry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
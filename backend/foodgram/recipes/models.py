@@ -1,5 +1,7 @@
 from django.db import models
-from django.db.models import Exists, OuterRef
+from django.db.models import F, Prefetch
+from django.db.models.expressions import Window
+from django.db.models.functions import RowNumber
 
 from users.models import User
 
@@ -12,6 +14,10 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(fields=['name', 'measurement_unit'],
+                         name='ingredient_name_unit_idx'),
+        ]
 
     def __str__(self):
         return self.name + ', ' + self.measurement_unit
@@ -31,19 +37,31 @@ class Tag(models.Model):
 
 
 class RecipeQuerySet(models.QuerySet):
-    def add_flags(self, user_id):
-        return self.annotate(
-            is_favorited=Exists(
-                Favorite.objects.filter(
-                    user_id=user_id, recipe=OuterRef('id')
-                )
-            )
-        ).annotate(
-            is_in_shopping_cart=Exists(
-                ShoppingList.objects.filter(
-                    user_id=user_id, recipe=OuterRef('id')
-                )
-            )
+    def with_related(self):
+        ingredients = RecipeIngridient.objects.select_related('ingredient')
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('recipeingridient_set', queryset=ingredients),
+        )
+
+    def mark_neighbours_stale(self):
+        """Queue the recipes for the next build_similar_recipes run."""
+        return self.filter(neighbours_stale=False).update(
+            neighbours_stale=True)
+
+    def latest_per_author(self, author_ids, limit):
+        ranked = (Recipe.objects.filter(author_id__in=author_ids)
+                  .order_by()
+                  .annotate(row_position=Window(
+                      expression=RowNumber(),
+                      partition_by=[F('author_id')],
+                      order_by=[F('pub_date').desc(), F('id').desc()]))
+                  .values('id', 'row_position'))
+        sql, params = ranked.query.sql_with_params()
+        return self.extra(
+            where=[f'{Recipe._meta.db_table}.id IN ('
+                   f'SELECT id FROM ({sql}) ranked WHERE row_position <= %s)'],
+            params=(*params, limit)
         )
 
 
@@ -67,6 +85,19 @@ class Recipe(models.Model):
     image = models.ImageField(upload_to='recipes/', blank=True, null=True)
     pub_date = models.DateTimeField("date published",
                                     auto_now_add=True,)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='в избранном')
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='в списках покупок')
+    popularity = models.FloatField(
+        default=0,
+        verbose_name='популярность')
+    neighbours_stale = models.BooleanField(
+        default=True,
+        db_index=True,
+        verbose_name='похожие рецепты устарели')
 
     objects = RecipeQuerySet.as_manager()
 
@@ -74,10 +105,26 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['-popularity', '-id'],
+                         name='recipe_popularity_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the signals find the files of a replaced image.
+        if 'image' in field_names:
+            instance.loaded_image = values[field_names.index('image')]
+        return instance
+
 
 class RecipeIngridient(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
@@ -93,6 +140,10 @@ class RecipeIngridient(models.Model):
                 fields=['recipe', 'ingredient'],
                 name='UniqueRecipeIngridient'),
         ]
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe'],
+                         name='recipeingredient_reverse_idx'),
+        ]
 
 
 class Favorite(models.Model):
@@ -104,6 +155,8 @@ class Favorite(models.Model):
     recipe = models.ForeignKey(Recipe,
                                on_delete=models.CASCADE,
                                related_name='favorites')
+    created = models.DateTimeField('добавлено', auto_now_add=True,
+                                   db_index=True)
 
     class Meta:
         constraints = [
@@ -145,6 +198,8 @@ class ShoppingList(models.Model):
     recipe = models.ForeignKey(Recipe,
                                on_delete=models.CASCADE,
                                related_name='shop_list',)
+    created = models.DateTimeField('добавлено', auto_now_add=True,
+                                   db_index=True)
 
     class Meta:
         constraints = [
@@ -152,3 +207,73 @@ class ShoppingList(models.Model):
                 fields=['user', 'recipe'],
                 name='UniqueShoppingEntry'),
         ]
+
+
+class CartIngredient(models.Model):
+    """Running ingredient totals of a user's shopping cart."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    amount = models.PositiveIntegerField(verbose_name='количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='UniqueCartIngredient'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """A recipe of a followed author, copied into the follower's feed."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь')
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='timeline_entries')
+    pub_date = models.DateTimeField('date published')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='UniqueTimelineEntry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class RecipeNeighbour(models.Model):
+    """A recipe with a similar ingredient set, found offline."""
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='neighbours')
+    neighbour = models.ForeignKey(Recipe,
+                                  on_delete=models.CASCADE,
+                                  related_name='+')
+    score = models.FloatField(verbose_name='сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'neighbour'],
+                name='UniqueRecipeNeighbour'),
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='neighbour_recipe_score_idx'),
+        ]
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils.timezone import now
+
+from .models import Favorite, Recipe, ShoppingList
+
+POPULAR = 'popular'
+POPULAR_ORDERING = ('-popularity', '-id')
+# Additions older than this many half-lives weigh less than 0.1%.
+HORIZON_HALF_LIVES = 10
+
+
+def weights():
+    return ((Favorite, settings.POPULARITY_FAVORITE_WEIGHT),
+            (ShoppingList, settings.POPULARITY_CART_WEIGHT))
+
+
+def hourly_additions(model, since):
+    return (model.objects.filter(created__gte=since)
+            .annotate(hour=TruncHour('created'))
+            .values('recipe_id', 'hour')
+            .annotate(added=Count('id'))
+            .values_list('recipe_id', 'hour', 'added'))
+
+
+def popularity_scores(moment):
+    """Favorite and cart additions per recipe, each halving its weight
+    every POPULARITY_HALF_LIFE_DAYS."""
+    half_life = timedelta(days=settings.POPULARITY_HALF_LIFE_DAYS)
+    since = moment - half_life * HORIZON_HALF_LIVES
+    scores = defaultdict(float)
+    for model, weight in weights():
+        for recipe_id, hour, added in hourly_additions(model, since):
+            scores[recipe_id] += (weight * added
+                                  * 0.5 ** ((moment - hour) / half_life))
+    return scores
+
+
+def update_popularity(batch_size=1000):
+    """Store fresh popularity scores; returns the number of recipes whose
+    score changed."""
+    scores = popularity_scores(now())
+    current = dict(Recipe.objects.filter(popularity__gt=0)
+                   .values_list('id', 'popularity'))
+    changed = [
+        Recipe(id=recipe_id, popularity=round(scores.get(recipe_id, 0), 6))
+        for recipe_id in current.keys() | scores.keys()
+        if round(scores.get(recipe_id, 0), 6) != current.get(recipe_id, 0)
+    ]
+    Recipe.objects.bulk_update(changed, ['popularity'],
+                               batch_size=batch_size)
+    return len(changed)
@@ -0,0 +1,156 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .catalog import RECIPE_INGREDIENTS, CatalogSnapshot, bump_version
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+
+def change_key(version):
+    return f'recipe-index-change:{version}'
+
+
+def publish_change(added=(), removed=(), dropped=()):
+    """Announce a change of recipe ingredients to the index of every worker
+    once the current transaction commits.
+
+    ``added`` and ``removed`` are (ingredient id, recipe id) pairs,
+    ``dropped`` the ids of deleted ingredients.
+    """
+    change = (tuple(added), tuple(removed), tuple(dropped))
+    if any(change):
+        transaction.on_commit(lambda: store_change(change))
+
+
+def store_change(change):
+    version = bump_version(RECIPE_INGREDIENTS)
+    cache.set(change_key(version), change, settings.CATALOG_CACHE_TTL)
+
+
+def edit_postings(recipe_ids, edits):
+    """Copy of a sorted posting list with recipes added or removed."""
+    recipe_ids = array('I', recipe_ids)
+    for recipe_id, present in edits:
+        position = bisect_left(recipe_ids, recipe_id)
+        found = (position < len(recipe_ids)
+                 and recipe_ids[position] == recipe_id)
+        if present and not found:
+            recipe_ids.insert(position, recipe_id)
+        elif found and not present:
+            del recipe_ids[position]
+    return recipe_ids
+
+
+class RecipeIngredientIndex(CatalogSnapshot):
+    """Inverted index from ingredient id to the ids of recipes using it.
+
+    Filtering by ingredients becomes set operations over the posting
+    lists instead of one join through RecipeIngridient per ingredient.
+    Writers publish their changes under the version they bump, so workers
+    apply them to the lists they have; only a gap in the published changes
+    or more than RECIPE_INDEX_MAX_CHANGES of them rebuild the index.
+    """
+    catalog = RECIPE_INGREDIENTS
+
+    def build(self):
+        from .models import RecipeIngridient
+
+        rows = (RecipeIngridient.objects
+                .order_by('ingredient_id', 'recipe_id')
+                .values_list('ingredient_id', 'recipe_id')
+                .iterator())
+        return {
+            ingredient_id: array('I', map(itemgetter(1), group))
+            for ingredient_id, group in groupby(rows, itemgetter(0))
+        }
+
+    def catch_up(self, postings, version, current):
+        if not 0 < current - version <= settings.RECIPE_INDEX_MAX_CHANGES:
+            return None
+        keys = [change_key(number)
+                for number in range(version + 1, current + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        for key in keys:
+            self.apply(postings, *changes[key])
+        return postings
+
+    def apply(self, postings, added, removed, dropped):
+        # Lists are replaced, never changed in place: other threads may be
+        # reading them.
+        for ingredient_id in dropped:
+            postings.pop(ingredient_id, None)
+        edits = defaultdict(list)
+        for ingredient_id, recipe_id in removed:
+            edits[ingredient_id].append((recipe_id, False))
+        for ingredient_id, recipe_id in added:
+            edits[ingredient_id].append((recipe_id, True))
+        for ingredient_id, recipe_edits in edits.items():
+            recipe_ids = edit_postings(postings.get(ingredient_id, ()),
+                                       recipe_edits)
+            if recipe_ids:
+                postings[ingredient_id] = recipe_ids
+            else:
+                postings.pop(ingredient_id, None)
+
+    def recipes(self, ingredient_ids, match=MATCH_ALL, limit=None):
+        """Ids of recipes with all (or any) of the given ingredients, or
+        None when there may be more than ``limit`` of them."""
+        postings = self.get_data()
+        lists = sorted((postings.get(ingredient_id, ())
+                        for ingredient_id in set(ingredient_ids)), key=len)
+        if not lists:
+            return set()
+        if match == MATCH_ANY:
+            if limit is not None and sum(map(len, lists)) > limit:
+                return None
+            return set().union(*lists)
+        result = set(lists[0])
+        for recipe_ids in lists[1:]:
+            if not result:
+                break
+            result.intersection_update(recipe_ids)
+        if limit is not None and len(result) > limit:
+            return None
+        return result
+
+    def filter(self, queryset, ingredient_ids, match=MATCH_ALL,
+               exclude=False):
+        """Keep (or with ``exclude`` drop) the recipes with the ingredients.
+
+        Up to RECIPE_INDEX_MAX_IDS matching ids are inlined into the query;
+        larger sets are left to the database as a subquery.
+        """
+        ingredient_ids = set(ingredient_ids)
+        recipe_ids = self.recipes(ingredient_ids, match,
+                                  settings.RECIPE_INDEX_MAX_IDS)
+        if recipe_ids is None:
+            recipe_ids = self.subquery(ingredient_ids, match)
+        if exclude:
+            return queryset.exclude(id__in=recipe_ids)
+        return queryset.filter(id__in=recipe_ids)
+
+    @staticmethod
+    def subquery(ingredient_ids, match):
+        from .models import RecipeIngridient
+
+        rows = RecipeIngridient.objects.filter(
+            ingredient_id__in=ingredient_ids).order_by()
+        if match == MATCH_ALL:
+            rows = (rows.values('recipe_id')
+                    .annotate(found=Count('id'))
+                    .filter(found=len(ingredient_ids)))
+        return rows.values('recipe_id')
+
+
+recipe_index = RecipeIngredientIndex()
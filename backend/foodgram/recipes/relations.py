@@ -0,0 +1,80 @@
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .catalog import default_cache_is_shared
+from .models import Favorite, Follow, ShoppingList
+
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping_cart'
+FOLLOWING = 'following'
+
+RELATIONS = {
+    FAVORITES: (Favorite, 'recipe_id'),
+    SHOPPING_CART: (ShoppingList, 'recipe_id'),
+    FOLLOWING: (Follow, 'author_id'),
+}
+
+
+def relation_key(kind, user_id):
+    return f'relations:{kind}:{user_id}'
+
+
+def relation_ttl():
+    # Invalidation only reaches the worker that handled the change when the
+    # cache is per process, so the others may keep a stale set this long.
+    if default_cache_is_shared():
+        return settings.RELATIONS_CACHE_TTL
+    return settings.RELATIONS_LOCAL_CACHE_TTL
+
+
+def load_relation(kind, user_id):
+    """Ids a user has in a relation, kept as a compact array in the cache."""
+    ids = cache.get(relation_key(kind, user_id))
+    if ids is None:
+        model, field = RELATIONS[kind]
+        ids = array('I', sorted(model.objects.filter(user_id=user_id)
+                                .values_list(field, flat=True)))
+        cache.set(relation_key(kind, user_id), ids, relation_ttl())
+    return ids
+
+
+def invalidate_relation(kind, user_ids):
+    cache.delete_many([relation_key(kind, user_id) for user_id in user_ids])
+
+
+class UserRelations:
+    """Per-request view of the current user's favorites, cart and follows."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._sets = {}
+
+    @classmethod
+    def from_context(cls, context):
+        relations = context.get('relations')
+        if relations is None:
+            relations = cls(context['request'].user.id)
+            context['relations'] = relations
+        return relations
+
+    def get(self, kind):
+        if kind not in self._sets:
+            self._sets[kind] = (
+                frozenset() if self.user_id is None
+                else frozenset(load_relation(kind, self.user_id))
+            )
+        return self._sets[kind]
+
+    @property
+    def favorites(self):
+        return self.get(FAVORITES)
+
+    @property
+    def shopping_cart(self):
+        return self.get(SHOPPING_CART)
+
+    @property
+    def following(self):
+        return self.get(FOLLOWING)
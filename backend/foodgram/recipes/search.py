@@ -0,0 +1,107 @@
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+TOKEN_RE = re.compile(r'\w+')
+SQLITE_TRIGGERS = {
+    'recipes_recipe_fts_insert': '''
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END;
+    ''',
+    'recipes_recipe_fts_delete': '''
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END;
+    ''',
+    'recipes_recipe_fts_update': '''
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END;
+    ''',
+}
+
+
+def fts5_query(query):
+    """Each word becomes a quoted prefix term so user input is never parsed
+    as FTS5 syntax."""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+def search_recipes(queryset, query):
+    """Filter recipes by name and text, most relevant first.
+
+    PostgreSQL uses the trigger-maintained ``search_vector`` column and its
+    GIN index, SQLite the FTS5 table kept in sync by triggers; other
+    backends fall back to a plain substring match without ranking.
+    """
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s, %s)'
+        params = (SEARCH_CONFIG, query)
+        queryset = queryset.extra(
+            where=[f'{table}.search_vector @@ {tsquery}'], params=params)
+        rank = RawSQL(f'ts_rank({table}.search_vector, {tsquery})', params,
+                      output_field=FloatField())
+    elif vendor == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return queryset.none()
+        queryset = queryset.extra(
+            where=[f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                   f'WHERE {FTS_TABLE} MATCH %s)'],
+            params=(match,))
+        rank = RawSQL(f'(SELECT -bm25({FTS_TABLE}, 10.0, 1.0) '
+                      f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                      f'AND rowid = {table}.id)', (match,),
+                      output_field=FloatField())
+    else:
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query))
+    return queryset.annotate(search_rank=rank).order_by(
+        '-search_rank', '-pub_date', '-id')
+
+
+def restore_search_triggers(using, **kwargs):
+    """post_migrate hook recreating the SQLite FTS triggers.
+
+    SQLite applies most column changes by copying recipes_recipe into a
+    new table, which drops its triggers; the index is rebuilt when any
+    trigger had to be recreated.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = 'recipes_recipe'")
+        existing = {name for name, in cursor.fetchall()}
+        missing = SQLITE_TRIGGERS.keys() - existing
+        if not missing:
+            return
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) "
+                       "VALUES ('rebuild')")
@@ -0,0 +1,153 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+from .cart import apply_cart_deltas, recipe_amounts, recipe_ingredients_changed
+from .catalog import INGREDIENTS, TAGS, bump_version
+from .counters import change_counter
+from .feed import add_author, fan_out, remove_author
+from .images import delete_image, ensure_variants
+from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngridient,
+                     ShoppingList, Tag)
+from .recipe_index import publish_change
+from .relations import (FAVORITES, FOLLOWING, SHOPPING_CART,
+                        invalidate_relation)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_version(INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version(TAGS)
+
+
+# RecipeIngridient has no delete receivers, so its rows are deleted with a
+# single query: the recipe serializer, the recipe and ingredient cascades
+# below and the single-row views do the bookkeeping (index, neighbours and
+# cart totals) once per batch. Single-row creates are handled here, the
+# serializer bulk-creates its rows and is not seen by this receiver.
+@receiver(post_save, sender=RecipeIngridient)
+def recipe_ingredient_added(sender, instance, created, **kwargs):
+    if created:
+        publish_change(added=[(instance.ingredient_id, instance.recipe_id)])
+        Recipe.objects.filter(pk=instance.recipe_id).mark_neighbours_stale()
+        recipe_ingredients_changed(
+            instance.recipe_id, {instance.ingredient_id: instance.amount})
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_removed(sender, instance, **kwargs):
+    publish_change(dropped=[instance.id])
+    Recipe.objects.filter(
+        recipeingridient__ingredient=instance).mark_neighbours_stale()
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, [instance.recipe_id], 'favorites_count', 1)
+        invalidate_relation(FAVORITES, [instance.user_id])
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    change_counter(Recipe, [instance.recipe_id], 'favorites_count', -1)
+    invalidate_relation(FAVORITES, [instance.user_id])
+
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_list_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, [instance.recipe_id],
+                       'shopping_cart_count', 1)
+        invalidate_relation(SHOPPING_CART, [instance.user_id])
+
+
+@receiver(post_save, sender=ShoppingList)
+def cart_totals_added(sender, instance, created, **kwargs):
+    if created:
+        apply_cart_deltas([instance.user_id],
+                          recipe_amounts([instance.recipe_id]))
+
+
+# pre_delete: when the recipe itself is deleted its ingredients are gone
+# by the time post_delete fires for the cascaded cart entries.
+@receiver(pre_delete, sender=ShoppingList)
+def cart_totals_removed(sender, instance, **kwargs):
+    apply_cart_deltas([instance.user_id],
+                      recipe_amounts([instance.recipe_id], sign=-1))
+
+
+@receiver(post_delete, sender=ShoppingList)
+def shopping_list_removed(sender, instance, **kwargs):
+    change_counter(Recipe, [instance.recipe_id], 'shopping_cart_count', -1)
+    invalidate_relation(SHOPPING_CART, [instance.user_id])
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, [instance.author_id], 'followers_count', 1)
+        invalidate_relation(FOLLOWING, [instance.user_id])
+        add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    change_counter(User, [instance.author_id], 'followers_count', -1)
+    invalidate_relation(FOLLOWING, [instance.user_id])
+    remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, [instance.author_id], 'recipes_count', 1)
+        fan_out([instance])
+    if instance.image:
+        ensure_variants(instance.image)
+
+
+def release_image(name):
+    if not Recipe.objects.filter(image=name).exists():
+        delete_image(Recipe._meta.get_field('image').storage, name)
+
+
+@receiver(post_save, sender=Recipe)
+def image_replaced(sender, instance, **kwargs):
+    previous = getattr(instance, 'loaded_image', None)
+    if previous and previous != instance.image.name:
+        transaction.on_commit(lambda: release_image(previous))
+    instance.loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=Recipe)
+def image_removed(sender, instance, **kwargs):
+    if instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: release_image(name))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_ingredients_removed(sender, instance, **kwargs):
+    publish_change(removed=(
+        (ingredient_id, instance.id) for ingredient_id
+        in instance.recipeingridient_set.values_list('ingredient_id',
+                                                     flat=True)))
+
+
+@receiver(pre_delete, sender=Recipe)
+def neighbour_removed(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        neighbours__neighbour=instance).mark_neighbours_stale()
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    change_counter(User, [instance.author_id], 'recipes_count', -1)
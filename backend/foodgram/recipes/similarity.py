@@ -0,0 +1,161 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+
+from .models import Recipe, RecipeIngridient, RecipeNeighbour
+
+
+def chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ingredient_matrix():
+    """Binary recipe × ingredient matrix with the recipe id of every row.
+
+    Recipes without ingredients have no row: they resemble nothing.
+    """
+    pairs = np.fromiter(
+        (value for pair in RecipeIngridient.objects
+         .values_list('recipe_id', 'ingredient_id').iterator()
+         for value in pair),
+        dtype=np.int64).reshape(-1, 2)
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+        shape=(len(recipe_ids), len(ingredient_ids)))
+    return recipe_ids, matrix
+
+
+def similarities(matrix, sizes, rows):
+    """Yield (row, columns, Jaccard indexes) of every row sharing at least
+    one ingredient with each of ``rows``."""
+    overlap = (matrix[rows] @ matrix.T).tocsr()
+    for position, row in enumerate(rows):
+        start, end = overlap.indptr[position], overlap.indptr[position + 1]
+        columns = overlap.indices[start:end]
+        common = overlap.data[start:end].astype(np.float64)
+        other = columns != row
+        columns, common = columns[other], common[other]
+        yield row, columns, common / (sizes[row] + sizes[columns] - common)
+
+
+def top(columns, scores, count):
+    """The ``count`` best scores, ties broken by the lower recipe id."""
+    if len(scores) > count:
+        threshold = np.partition(scores, len(scores) - count)[-count]
+        best = scores >= threshold
+        columns, scores = columns[best], scores[best]
+    order = np.lexsort((columns, -scores))[:count]
+    return columns[order], scores[order]
+
+
+def locate(recipe_ids, ids):
+    """Matrix rows of the given recipes and a mask of those having one."""
+    ids = np.asarray(ids, dtype=np.int64)
+    rows = np.searchsorted(recipe_ids, ids)
+    found = rows < len(recipe_ids)
+    found[found] = recipe_ids[rows[found]] == ids[found]
+    return rows, found
+
+
+def current_bounds(recipe_ids, count):
+    """Lowest stored score per row, or 0 for rows with fewer than
+    ``count`` neighbours."""
+    stored = list(RecipeNeighbour.objects.values('recipe_id')
+                  .annotate(lowest=Min('score'), stored=Count('id'))
+                  .filter(stored__gte=count)
+                  .values_list('recipe_id', 'lowest'))
+    bounds = np.zeros(len(recipe_ids))
+    if stored:
+        ids, lowest = zip(*stored)
+        rows, found = locate(recipe_ids, ids)
+        bounds[rows[found]] = np.asarray(lowest)[found]
+    return bounds
+
+
+def affected_rows(recipe_ids, matrix, sizes, stale_ids, count, batch_size):
+    """Rows whose neighbours may change because ``stale_ids`` changed.
+
+    Only pairs with a stale recipe change their score, so besides the
+    stale recipes themselves these are the recipes that hold one of them
+    as a neighbour or would now rank one above their weakest neighbour.
+    """
+    rows, found = locate(recipe_ids, stale_ids)
+    stale_rows = rows[found]
+    affected = set(stale_rows.tolist())
+    bounds = current_bounds(recipe_ids, count)
+    for batch in chunks(stale_rows, batch_size):
+        for row, columns, scores in similarities(matrix, sizes, batch):
+            affected.update(columns[scores >= bounds[columns]].tolist())
+    for batch in chunks(stale_ids.tolist(), batch_size):
+        holders = list(RecipeNeighbour.objects
+                       .filter(neighbour_id__in=batch)
+                       .values_list('recipe_id', flat=True))
+        rows, found = locate(recipe_ids, holders)
+        affected.update(rows[found].tolist())
+    return sorted(affected)
+
+
+def stale_recipes():
+    """Ids of recipes whose ingredients changed since their neighbours were
+    stored."""
+    return np.fromiter(
+        Recipe.objects.filter(neighbours_stale=True).order_by('id')
+        .values_list('id', flat=True).iterator(),
+        dtype=np.int64)
+
+
+def clear_stale(ids, stale_ids):
+    """Clear the mark of the processed recipes that were stale when the
+    run started; a run that stops halfway leaves the rest marked."""
+    ids = np.intersect1d(ids, stale_ids).tolist()
+    if ids:
+        Recipe.objects.filter(id__in=ids).update(neighbours_stale=False)
+
+
+@transaction.atomic
+def store_neighbours(recipe_ids, matrix, sizes, rows, count, stale_ids):
+    ids = recipe_ids[rows].tolist()
+    RecipeNeighbour.objects.filter(recipe_id__in=ids).delete()
+    clear_stale(ids, stale_ids)
+    neighbours = []
+    for row, columns, scores in similarities(matrix, sizes, rows):
+        columns, scores = top(columns, scores, count)
+        neighbours.extend(
+            RecipeNeighbour(recipe_id=int(recipe_ids[row]),
+                            neighbour_id=int(recipe_ids[column]),
+                            score=float(score))
+            for column, score in zip(columns, scores))
+    RecipeNeighbour.objects.bulk_create(neighbours)
+
+
+def refresh_neighbours(count, batch_size, full=False, progress=None):
+    """Recompute stored neighbours of changed recipes, or of all of them
+    with ``full``; returns the number of recipes refreshed."""
+    stale_ids = stale_recipes()
+    recipe_ids, matrix = ingredient_matrix()
+    sizes = np.asarray(matrix.sum(axis=1), dtype=np.float64).ravel()
+    if full or len(stale_ids) * 2 > len(recipe_ids):
+        rows = list(range(len(recipe_ids)))
+        RecipeNeighbour.objects.filter(
+            recipe__recipeingridient__isnull=True).delete()
+    else:
+        rows = affected_rows(recipe_ids, matrix, sizes, stale_ids, count,
+                             batch_size)
+    # Recipes that lost all ingredients keep no neighbours either.
+    for batch in chunks(np.setdiff1d(stale_ids, recipe_ids).tolist(),
+                        batch_size):
+        with transaction.atomic():
+            RecipeNeighbour.objects.filter(recipe_id__in=batch).delete()
+            clear_stale(batch, stale_ids)
+    done = 0
+    for batch in chunks(rows, batch_size):
+        store_neighbours(recipe_ids, matrix, sizes, batch, count, stale_ids)
+        done += len(batch)
+        if progress:
+            progress(done, len(rows))
+    return len(rows)
@@ -0,0 +1,268 @@
+import base64
+import json
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import connection, transaction
+from django.core.files.base import ContentFile
+from django.utils.dateparse import parse_datetime
+
+from users.models import User
+from .counters import change_counter
+from .feed import fan_out
+from .models import Ingredient, Recipe, RecipeIngridient, Tag
+
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+RECIPE_FIELDS = ('id', 'name', 'text', 'cooking_time', 'image', 'pub_date',
+                 *(f'author__{field}' for field in AUTHOR_FIELDS))
+
+
+def chunk_tags(recipe_ids):
+    tags = defaultdict(list)
+    rows = (Recipe.tags.through.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by('recipe_id', 'tag_id')
+            .values_list('recipe_id', 'tag__slug', 'tag__name', 'tag__color'))
+    for recipe_id, slug, name, color in rows:
+        tags[recipe_id].append({'slug': slug, 'name': name, 'color': color})
+    return tags
+
+
+def chunk_ingredients(recipe_ids):
+    ingredients = defaultdict(list)
+    rows = (RecipeIngridient.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by('recipe_id', 'id')
+            .values_list('recipe_id', 'ingredient__name',
+                         'ingredient__measurement_unit', 'amount'))
+    for recipe_id, name, measurement_unit, amount in rows:
+        ingredients[recipe_id].append({
+            'name': name, 'measurement_unit': measurement_unit,
+            'amount': amount})
+    return ingredients
+
+
+def image_data(name):
+    storage = Recipe._meta.get_field('image').storage
+    if not name or not storage.exists(name):
+        return None
+    with storage.open(name) as file:
+        return base64.b64encode(file.read()).decode()
+
+
+def recipe_chunks(chunk_size):
+    """Recipe rows ordered by id, read chunk by chunk by keyset."""
+    last_id = 0
+    while True:
+        rows = list(Recipe.objects.filter(id__gt=last_id).order_by('id')
+                    .values(*RECIPE_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        yield rows
+
+
+def export_recipes(stream, chunk_size=1000, with_images=False,
+                   progress=None):
+    """Write every recipe as a self-contained line of JSON, with its
+    author, tags and ingredients; returns the number written."""
+    exported = 0
+    for rows in recipe_chunks(chunk_size):
+        recipe_ids = [row['id'] for row in rows]
+        tags = chunk_tags(recipe_ids)
+        ingredients = chunk_ingredients(recipe_ids)
+        for row in rows:
+            recipe = {
+                'author': {field: row[f'author__{field}']
+                           for field in AUTHOR_FIELDS},
+                'name': row['name'],
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+                'pub_date': row['pub_date'].isoformat(),
+                'image': row['image'] or None,
+                'tags': tags[row['id']],
+                'ingredients': ingredients[row['id']],
+            }
+            if with_images:
+                recipe['image_data'] = image_data(row['image'])
+            stream.write(json.dumps(recipe, ensure_ascii=False) + '\n')
+        exported += len(rows)
+        if progress:
+            progress(exported)
+    return exported
+
+
+class Progress:
+    """Progress callback reporting the running count and throughput."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.started = time.perf_counter()
+
+    def __call__(self, done):
+        elapsed = time.perf_counter() - self.started
+        self.stream.write(
+            f'Рецептов: {done}, {done / max(elapsed, 1e-6):.0f} в секунду')
+
+
+class RecipeImporter:
+    """Create recipes from NDJSON lines in batches of ``batch_size``.
+
+    Ids are not kept: authors are matched by email, then by username, tags
+    by slug and ingredients by (name, measurement unit); whatever is
+    missing is created.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, measurement_unit): ingredient_id
+            for ingredient_id, name, measurement_unit in Ingredient.objects
+            .values_list('id', 'name', 'measurement_unit').iterator()
+        }
+        self.created_tags = 0
+        self.created_ingredients = 0
+        self.created_users = 0
+
+    def import_lines(self, lines, progress=None):
+        """Import recipes line by line; returns the number imported."""
+        imported = 0
+        lines = (line for line in lines if line.strip())
+        while True:
+            batch = [json.loads(line)
+                     for line in islice(lines, self.batch_size)]
+            if not batch:
+                return imported
+            self.import_batch(batch)
+            imported += len(batch)
+            if progress:
+                progress(imported)
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        authors = self.resolve_authors([data['author'] for data in batch])
+        self.resolve_tags(
+            tag for data in batch for tag in data['tags'])
+        self.resolve_ingredients(
+            ingredient for data in batch for ingredient in data['ingredients'])
+        recipes = [
+            Recipe(author_id=authors[data['author']['email']],
+                   name=data['name'], text=data['text'],
+                   cooking_time=data['cooking_time'],
+                   image=self.save_image(data))
+            for data in batch
+        ]
+        self.create_with_ids(Recipe, recipes)
+        # auto_now_add overrides pub_date on insert; restore the original.
+        for recipe, data in zip(recipes, batch):
+            recipe.pub_date = parse_datetime(data['pub_date'])
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id,
+                                tag_id=self.tags[tag['slug']])
+            for recipe, data in zip(recipes, batch)
+            for tag in data['tags']
+        )
+        RecipeIngridient.objects.bulk_create(
+            RecipeIngridient(
+                recipe_id=recipe.id, amount=ingredient['amount'],
+                ingredient_id=self.ingredients[
+                    (ingredient['name'], ingredient['measurement_unit'])])
+            for recipe, data in zip(recipes, batch)
+            for ingredient in data['ingredients']
+        )
+        # bulk_create skips the signals that keep these up to date; new
+        # recipes are in no favorites or carts yet.
+        self.count_recipes(recipes)
+        fan_out(recipes)
+
+    def count_recipes(self, recipes):
+        """Add the new recipes to their authors' recipes_count."""
+        authors = defaultdict(list)
+        for author_id, count in Counter(
+                recipe.author_id for recipe in recipes).items():
+            authors[count].append(author_id)
+        for count, author_ids in authors.items():
+            change_counter(User, author_ids, 'recipes_count', count)
+
+    def create_with_ids(self, model, objects):
+        """bulk_create that leaves primary keys on ``objects`` everywhere.
+
+        Backends that cannot return ids from a bulk insert get them by
+        reading back the rows inserted after the previous highest id; if
+        someone else inserted rows meanwhile the counts differ and the
+        batch is rolled back.
+        """
+        if not objects:
+            return
+        if connection.features.can_return_ids_from_bulk_insert:
+            model.objects.bulk_create(objects)
+            return
+        last_id = (model.objects.order_by('-id')
+                   .values_list('id', flat=True).first() or 0)
+        model.objects.bulk_create(objects)
+        ids = list(model.objects.filter(id__gt=last_id).order_by('id')
+                   .values_list('id', flat=True))
+        if len(ids) != len(objects):
+            raise RuntimeError(
+                f'{model._meta.label}: не удалось получить id новых строк')
+        for instance, pk in zip(objects, ids):
+            instance.pk = pk
+
+    def resolve_authors(self, authors):
+        """Map author emails to user ids, creating missing users."""
+        by_email = {author['email']: author for author in authors}
+        found = dict(User.objects.filter(email__in=list(by_email))
+                     .values_list('email', 'id'))
+        usernames = {author['username']: email
+                     for email, author in by_email.items()
+                     if email not in found}
+        existing = (User.objects.filter(username__in=list(usernames))
+                    .values_list('username', 'id'))
+        for username, user_id in existing:
+            found[usernames[username]] = user_id
+        missing = [
+            User(username=author['username'], email=email,
+                 first_name=author['first_name'],
+                 last_name=author['last_name'])
+            for email, author in by_email.items() if email not in found
+        ]
+        for user in missing:
+            user.set_unusable_password()
+        self.create_with_ids(User, missing)
+        found.update((user.email, user.id) for user in missing)
+        self.created_users += len(missing)
+        return found
+
+    def resolve_tags(self, tags):
+        missing = {}
+        for tag in tags:
+            if tag['slug'] not in self.tags:
+                missing[tag['slug']] = Tag(**tag)
+        if missing:
+            self.create_with_ids(Tag, list(missing.values()))
+            self.tags.update((tag.slug, tag.id) for tag in missing.values())
+            self.created_tags += len(missing)
+
+    def resolve_ingredients(self, ingredients):
+        missing = {}
+        for ingredient in ingredients:
+            key = (ingredient['name'], ingredient['measurement_unit'])
+            if key not in self.ingredients:
+                missing[key] = Ingredient(
+                    name=key[0], measurement_unit=key[1])
+        if missing:
+            self.create_with_ids(Ingredient, list(missing.values()))
+            self.ingredients.update(
+                (key, ingredient.id) for key, ingredient in missing.items())
+            self.created_ingredients += len(missing)
+
+    def save_image(self, data):
+        content = data.get('image_data')
+        if not content:
+            return data['image']
+        storage = Recipe._meta.get_field('image').storage
+        return storage.save(data['image'],
+                            ContentFile(base64.b64decode(content)))
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_on_demand(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User.objects.filter(
+        followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).update(feed_on_demand=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20261018_0409'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_on_demand',
+            field=models.BooleanField(default=False, verbose_name='ленты читают рецепты напрямую'),
+        ),
+        migrations.RunPython(mark_on_demand, migrations.RunPython.noop),
+    ]
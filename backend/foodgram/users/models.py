@@ -4,3 +4,12 @@ from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='количество рецептов')
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='количество подписчиков')
+    feed_on_demand = models.BooleanField(
+        default=False,
+        verbose_name='ленты читают рецепты напрямую')
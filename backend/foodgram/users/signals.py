@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import User
+from .tokens import bump_token_versions
+
+
+@receiver(post_delete, sender=Token)
+def token_removed(sender, instance, **kwargs):
+    bump_token_versions([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    bump_token_versions(
+        Token.objects.filter(user=instance).values_list('key', flat=True))
@@ -0,0 +1,31 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+def token_digest(key):
+    """Tokens are credentials, so cache keys only carry their hash."""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def version_key(key):
+    return f'token-version:{token_digest(key)}'
+
+
+def get_token_version(key):
+    """Version of a token's cached authentication, shared through the
+    default cache."""
+    version = cache.get(version_key(key))
+    if version is not None:
+        return version
+    cache.add(version_key(key), time.time_ns(), None)
+    return cache.get(version_key(key))
+
+
+def bump_token_versions(keys):
+    for key in keys:
+        try:
+            cache.incr(version_key(key))
+        except ValueError:
+            cache.set(version_key(key), time.time_ns(), None)